@@ -0,0 +1,90 @@
+# coding: utf-8
+"""
+A module for packing datapoints into insert requests of a good size.
+"""
+from collections import OrderedDict
+
+from payload import DataPoints
+
+DATA_POINTS_MAX = 100000  # Maximum number of datapoints the API accepts in one request
+BATCH_MAX = 1000  # Maximum number of time series batched at once
+
+
+class DatapointBatcher:
+    """Collect datapoints per externalId and submit them to 'uploader' in requests of bounded size.
+
+    A request holds at most 'max_time_series' time series and 'max_data_points' datapoints, long series are split
+    across requests. Datapoints for the same externalId are coalesced until submitted, also across files, and every
+    request is attributed to the files with datapoints in it, so a failed request only fails those files. With
+    'last_values', datapoints already added or unchanged are dropped before they are collected.
+    """
+
+    def __init__(
+        self, uploader, max_time_series: int = BATCH_MAX, max_data_points: int = DATA_POINTS_MAX, last_values=None
+    ):
+        self.uploader = uploader
+        self.last_values = last_values
+        self.max_time_series = max_time_series
+        self.max_data_points = max_data_points
+        self._pending = OrderedDict()  # externalId -> list of (job, DataPoints)
+        self._count = 0
+
+    def add(self, job, external_id: str, data_points: DataPoints) -> None:
+        """Add datapoints from the file of 'job', submitting requests as soon as one is full."""
+        if self.last_values is not None:
+            data_points = self.last_values.filter(external_id, data_points)
+        if not len(data_points):
+            return
+        job.add_data_points(len(data_points))
+
+        pending = self._pending.get(external_id)
+        if pending is None:
+            self._pending[external_id] = [(job, data_points)]
+        else:
+            pending.append((job, data_points))
+        self._count += len(data_points)
+
+        while self._count >= self.max_data_points or len(self._pending) >= self.max_time_series:
+            self._submit_request()
+
+    def discard(self, job) -> None:
+        """Drop the datapoints from the file of 'job' not yet submitted, as the file failed."""
+        for external_id, parts in list(self._pending.items()):
+            kept = [(part_job, data_points) for part_job, data_points in parts if part_job is not job]
+            if len(kept) == len(parts):
+                continue
+            self._count -= sum(len(data_points) for part_job, data_points in parts if part_job is job)
+            if kept:
+                self._pending[external_id] = kept
+            else:
+                del self._pending[external_id]
+
+    def flush(self) -> None:
+        """Submit all collected datapoints."""
+        while self._pending:
+            self._submit_request()
+
+    def _submit_request(self) -> None:
+        items = []
+        ranges = OrderedDict()  # job -> list of (externalId, first, last) of its datapoints in the request
+        room = self.max_data_points
+        while self._pending and len(items) < self.max_time_series and room > 0:
+            external_id, parts = next(iter(self._pending.items()))
+            taken = []
+            while parts and room > 0:
+                job, data_points = parts[0]
+                if len(data_points) <= room:
+                    parts.pop(0)
+                else:
+                    parts[0] = job, data_points[room:]
+                    data_points = data_points[:room]
+                taken.append(data_points)
+                room -= len(data_points)
+                first, last = int(data_points.timestamps[0]), int(data_points.timestamps[-1])
+                ranges.setdefault(job, []).append((external_id, first, last))
+            if not parts:
+                del self._pending[external_id]
+            items.append((external_id, DataPoints.concat(taken)))
+
+        self._count -= self.max_data_points - room
+        self.uploader.submit(list(ranges), items, ranges)
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+A script that benchmarks the stages of the extractor on synthetic Tebis files, against a local stub of CDF.
+"""
+
+import argparse
+import csv
+import gzip
+import json
+import logging
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict
+from unittest import mock
+
+import numpy as np
+
+from batching import DatapointBatcher
+from csv_extractor import process_csv_file, process_files
+from csv_parser import iter_csv_streams, parse_csv_file
+from payload import GZIP_LEVEL, DataPoints, encode_json
+from time_series_cache import TimeSeriesCache
+from uploader import FileJob, Uploader
+
+logger = logging.getLogger(__name__)
+
+
+def write_tebis_file(
+    path,
+    columns: int,
+    rows: int,
+    empty_ratio: float = 0.1,
+    non_float_ratio: float = 0.0,
+    decimal_comma: bool = True,
+    start: int = 1550092501,
+) -> None:
+    """Write a Tebis formatted file with 'columns' time series and 'rows' seconds of data.
+
+    A share 'empty_ratio' of the cells are empty and 'non_float_ratio' hold text instead of a number.
+    """
+    rnd = random.Random(columns * rows + start)
+    decimal_point = "," if decimal_comma else "."
+    with open(path, "w", encoding="latin-1") as f:
+        f.write(";" + ";".join("{} : TEST{}".format(i, i) for i in range(columns)) + "\n")
+        f.write("Zeitstempel;" + ";".join("bar" for _ in range(columns)) + "\n")
+        for row in range(rows):
+            cells = [str(start + row)]
+            for _ in range(columns):
+                draw = rnd.random()
+                if draw < empty_ratio:
+                    cells.append("")
+                elif draw < empty_ratio + non_float_ratio:
+                    cells.append("Stoerung")
+                else:
+                    cells.append("{:.6f}".format(rnd.random() * 100).replace(".", decimal_point))
+            f.write(";".join(cells) + "\n")
+
+
+def write_tebis_files(folder, files: int, **kwargs) -> list:
+    """Write 'files' Tebis files a minute apart to 'folder', return their paths."""
+    paths = []
+    for i in range(files):
+        start = 1550092501 + 60 * i
+        paths.append(Path(folder, "TEBIS_FK_{}.csv".format(start + 59)))
+        write_tebis_file(paths[-1], start=start, **kwargs)
+    return paths
+
+
+class StubPost:
+    """Stand-in for posting request bodies to CDF, gzipping them and answering after 'latency' seconds.
+
+    The datapoints posted are counted in 'data_points'.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.data_points = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, body: bytes) -> None:
+        gzip.compress(body, GZIP_LEVEL)
+        time.sleep(self.latency)
+        with self._lock:
+            self.data_points += body.count(b'"timestamp"')
+
+
+def stub_client(latency: float = 0.0):
+    """Stand-in for the time series endpoints of CogniteClient, answering after 'latency' seconds."""
+
+    def retrieve_multiple(external_ids, ignore_unknown_ids=False):
+        time.sleep(latency)
+        return []
+
+    def create(time_series):
+        time.sleep(latency)
+        return time_series
+
+    return mock.Mock(time_series=mock.Mock(retrieve_multiple=retrieve_multiple, create=create))
+
+
+# Reference implementation the columnar parser is checked and measured against, row based as the extractor was
+def create_data_points(values, timestamps):
+    """Return list of tuples (ts, value), because next function gets that format, not Datapoint"""
+    data_points = []
+    rejected = 0
+
+    for i, value_string in enumerate(values):
+        if value_string:
+            try:
+                value = float(value_string.replace(",", "."))
+            except ValueError:
+                rejected += 1
+                continue
+            data_points.append((int(timestamps[i]) * 1000, value))
+    if rejected:
+        logger.info("Skipped {} values that are not numbers".format(rejected))
+    return data_points
+
+
+def get_parsed_file(path) -> Dict[str, list]:
+    """Parse the csv file and return the data in a {col_name -> list_of_row_items} dictionary"""
+    parsed_file = defaultdict(list)
+    for f in iter_csv_streams(path):
+        data = csv.DictReader(f, delimiter=";")
+        for row in data:
+            for k, v in row.items():
+                parsed_file[k].append(v)
+    return parsed_file
+
+
+def column_data_points(timestamps_ms: np.ndarray, values: np.ndarray, valid: np.ndarray) -> list:
+    """Return list of tuples (ts, value) for the valid cells of one column."""
+    return list(zip(timestamps_ms[valid].tolist(), values[valid].tolist()))
+
+
+def run_get_parsed_file(path) -> int:
+    """get_parsed_file, the row based reference parser."""
+    return sum(len(values) - 1 for values in get_parsed_file(path).values())
+
+
+def run_create_data_points(parsed_file) -> int:
+    """create_data_points on every column of a file from get_parsed_file, the row based reference conversion."""
+    timestamps = parsed_file.pop("")[1:]
+    return sum(len(create_data_points(v[1:], timestamps)) for v in parsed_file.values())
+
+
+def run_columnar_parse(path) -> int:
+    """parse_csv_file and column_data_points."""
+    parsed_file = parse_csv_file(path)
+    timestamps = parsed_file.timestamps * 1000
+    return sum(
+        len(column_data_points(timestamps, parsed_file.values[col], parsed_file.valid[col]))
+        for col in range(len(parsed_file.column_names))
+    )
+
+
+def run_tuple_payload(path) -> int:
+    """Tuples per datapoint, turned into dicts, dumped and gzipped as by CogniteClient.datapoints.insert_multiple."""
+    parsed_file = parse_csv_file(path)
+    timestamps = parsed_file.timestamps * 1000
+    items = [
+        {
+            "externalId": str(col),
+            "datapoints": column_data_points(timestamps, parsed_file.values[col], parsed_file.valid[col]),
+        }
+        for col in range(len(parsed_file.column_names))
+    ]
+    for item in items:
+        item["datapoints"] = [{"timestamp": t, "value": v} for t, v in item["datapoints"]]
+    gzip.compress(json.dumps({"items": items}).encode())
+    return sum(len(item["datapoints"]) for item in items)
+
+
+def run_array_payload(path) -> int:
+    """DataPoints arrays written straight into the request body, as by the upload threads."""
+    parsed_file = parse_csv_file(path)
+    timestamps = parsed_file.timestamps * 1000
+    items = [
+        (str(col), DataPoints.from_column(timestamps, parsed_file.values[col], parsed_file.valid[col]))
+        for col in range(len(parsed_file.column_names))
+    ]
+    gzip.compress(encode_json(items), GZIP_LEVEL)
+    return sum(len(data_points) for _, data_points in items)
+
+
+def run_process_csv_file(path) -> int:
+    """process_csv_file into a batcher, without uploading."""
+    client = stub_client()
+    job = FileJob(path)
+    batcher = DatapointBatcher(mock.Mock())
+    return process_csv_file(client, mock.MagicMock(), batcher, job, TimeSeriesCache(client))[0]
+
+
+def run_process_files(paths, parse_workers: int, upload_workers: int, latency: float) -> int:
+    """process_files end to end with the upload pool posting to a stub of CDF."""
+    client = stub_client(latency)
+    post = StubPost(latency)
+    uploader = Uploader(client, upload_workers, post=post)
+    try:
+        process_files(client, mock.MagicMock(), paths, TimeSeriesCache(client), None, None, parse_workers, uploader)
+    finally:
+        uploader.stop()
+    return post.data_points
+
+
+def measure(func, make_args, repeat: int = 1):
+    """Return best wall time, peak traced memory in bytes and result of calling 'func' with 'make_args()'.
+
+    The arguments are made anew for every call, outside of the measurement.
+    """
+    seconds = float("inf")
+    for _ in range(repeat):
+        args = make_args()
+        start_time = time.perf_counter()
+        result = func(*args)
+        seconds = min(seconds, time.perf_counter() - start_time)
+
+    args = make_args()
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return seconds, peak, result
+
+
+def _report(stage, files, seconds, peak, data_points) -> None:
+    print(
+        "{:<22} {:>9.3f} s {:>10.1f} files/s {:>13.0f} datapoints/s {:>9.1f} MiB peak".format(
+            stage, seconds, files / seconds, data_points / seconds, peak / 2 ** 20
+        )
+    )
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as folder:
+
+        def make_files():
+            return write_tebis_files(
+                folder,
+                args.files,
+                columns=args.columns,
+                rows=args.rows,
+                empty_ratio=args.empty_ratio,
+                non_float_ratio=args.non_float_ratio,
+                decimal_comma=not args.dot_decimal,
+            )
+
+        path = make_files()[0]
+        print("{} files of {} columns x {} rows".format(args.files, args.columns, args.rows))
+
+        for stage, func, make_args in [
+            ("get_parsed_file", run_get_parsed_file, lambda: (path,)),
+            ("create_data_points", run_create_data_points, lambda: (get_parsed_file(path),)),
+            ("parse_csv_file", run_columnar_parse, lambda: (path,)),
+            ("tuple payload", run_tuple_payload, lambda: (path,)),
+            ("array payload", run_array_payload, lambda: (path,)),
+            ("process_csv_file", run_process_csv_file, lambda: (path,)),
+        ]:
+            seconds, peak, data_points = measure(func, make_args, args.repeat)
+            _report(stage, 1, seconds, peak, data_points)
+
+        # process_files deletes the files when done, so they are written again for every run
+        seconds, peak, data_points = measure(
+            run_process_files,
+            lambda: (make_files(), args.parse_workers, args.upload_workers, args.upload_latency),
+            args.repeat,
+        )
+        _report("process_files", args.files, seconds, peak, data_points)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=20, help="Number of synthetic files")
+    parser.add_argument("--columns", type=int, default=2000, help="Number of time series per file")
+    parser.add_argument("--rows", type=int, default=60, help="Number of rows per file")
+    parser.add_argument("--empty-ratio", type=float, default=0.1, help="Share of empty cells")
+    parser.add_argument("--non-float-ratio", type=float, default=0.0, help="Share of cells with text")
+    parser.add_argument("--dot-decimal", action="store_true", help="Write decimal point instead of decimal comma")
+    parser.add_argument("--parse-workers", type=int, default=1, help="Number of processes parsing files")
+    parser.add_argument("--upload-workers", type=int, default=10, help="Number of threads uploading")
+    parser.add_argument("--upload-latency", type=float, default=0.05, help="Seconds the stub CDF takes per request")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs per stage, the best is reported")
+    main(parser.parse_args())
@@ -0,0 +1,112 @@
+# coding: utf-8
+"""
+A module for keeping track of how far a historical backfill has come, so it can resume after a restart.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STARTED = "started"
+FINISHED = "finished"
+SAMPLE_SIZE = 64 * 1024  # Bytes hashed from the start and the end of a file to tell it apart
+
+
+def file_identity(path) -> Tuple[int, int, str]:
+    """Return size, modification time in nanoseconds and a hash of the start and end of the file at 'path'."""
+    stat = os.stat(str(path))
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        digest.update(f.read(SAMPLE_SIZE))
+        if stat.st_size > 2 * SAMPLE_SIZE:
+            f.seek(-SAMPLE_SIZE, os.SEEK_END)
+        digest.update(f.read())
+    return stat.st_size, stat.st_mtime_ns, digest.hexdigest()
+
+
+class CheckpointStore:
+    """Files started and finished, and the datapoints of started files known to be uploaded, in a SQLite file at 'path'.
+
+    Files are identified by name, size, modification time and hash. For each request acknowledged by CDF, the time
+    range of the datapoints of each time series it held from a file is recorded. A file started but not finished in an
+    earlier run is resumed, skipping only the datapoints inside the ranges recorded for that file. Failed files are
+    forgotten, so they are processed in full if put back.
+    """
+
+    def __init__(self, path=None):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(":memory:" if path is None else str(path), check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS files "
+                "(name TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, hash TEXT, status TEXT)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS uploaded (name TEXT, external_id TEXT, first INTEGER, last INTEGER)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS uploaded_name ON uploaded (name)")
+        self._started = set()
+
+    def file_status(self, path) -> Optional[str]:
+        """Return STARTED or FINISHED if the file at 'path' was seen by an earlier run, else None."""
+        row = self._db.execute("SELECT size, mtime_ns, hash, status FROM files WHERE name = ?", (path.name,)).fetchone()
+        if row is None:
+            return None
+        try:
+            identity = file_identity(path)
+        except OSError:
+            return None
+        return row[3] if tuple(row[:3]) == identity else None
+
+    def progress(self, path) -> Dict[str, List[Tuple[int, int]]]:
+        """Return the time ranges (first, last) per externalId of the datapoints of the file at 'path' uploaded."""
+        ranges = defaultdict(list)
+        for external_id, first, last in self._db.execute(
+            "SELECT external_id, first, last FROM uploaded WHERE name = ?", (path.name,)
+        ):
+            ranges[external_id].append((first, last))
+        return dict(ranges)
+
+    def start(self, job, resumed: bool = False) -> None:
+        """Record that the file of 'job' is being processed, keeping its progress if 'resumed'."""
+        try:
+            identity = file_identity(job.path)
+        except OSError as exc:  # Possible that file no longer exists, multiple extractors
+            logger.debug("Failed to checkpoint file {!s}: {!s}".format(job.path, exc))
+            return
+        with self._lock:
+            self._started.add(job)
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)", (job.path.name,) + identity + (STARTED,)
+                )
+                if not resumed:
+                    self._db.execute("DELETE FROM uploaded WHERE name = ?", (job.path.name,))
+
+    def uploaded(self, job, ranges: List[Tuple[str, int, int]]) -> None:
+        """Record that the datapoints of the file of 'job' in the (externalId, first, last) 'ranges' are uploaded."""
+        with self._lock:
+            if job not in self._started:
+                return
+            with self._db:
+                self._db.executemany(
+                    "INSERT INTO uploaded VALUES (?, ?, ?, ?)", [(job.path.name,) + item for item in ranges]
+                )
+
+    def done(self, job) -> None:
+        """Record that the file of 'job' is uploaded, or forget it if it failed."""
+        with self._lock:
+            if job not in self._started:
+                return
+            self._started.discard(job)
+            with self._db:
+                if job.failed:
+                    self._db.execute("DELETE FROM files WHERE name = ?", (job.path.name,))
+                else:
+                    self._db.execute("UPDATE files SET status = ? WHERE name = ?", (FINISHED, job.path.name))
+                self._db.execute("DELETE FROM uploaded WHERE name = ?", (job.path.name,))
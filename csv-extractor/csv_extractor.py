@@ -2,279 +2,323 @@
 """
 A module for extracting datapoints from CSV files.
 """
-import csv
 import logging
-import sys
-import threading
 import time
-from collections import defaultdict
-from itertools import chain
-from operator import itemgetter
-from random import shuffle
-from typing import Dict
 
-from cognite.client.data_classes.time_series import TimeSeries
-from cognite.client.exceptions import CogniteAPIError
+from batching import DatapointBatcher
+from checkpoint import FINISHED, STARTED
+from discovery import FileIndex
+from payload import DataPoints
+from csv_parser import ParsedFile, iter_parsed_files, parse_csv_file
+from uploader import FileJob, Uploader
 
 logger = logging.getLogger(__name__)
 
-
-BATCH_MAX = 1000  # Maximum number of time series batched at once
+FILE_WINDOW = 20  # Number of files whose datapoints may be coalesced into the same requests
 
 
 def extract_data_points(
-    client, monitor, time_series_cache, live_mode: bool, time_from, time_until, folder_path, failed_path, finished_path
+    client,
+    monitor,
+    time_series_cache,
+    live_mode: bool,
+    time_from,
+    time_until,
+    folder_path,
+    failed_path,
+    finished_path,
+    parse_workers: int = 1,
+    upload_workers: int = 10,
+    chunk_rows: int = None,
+    spool=None,
+    checkpoint=None,
+    leases=None,
+    last_values=None,
 ):
     """Find and publish all data points in files found in 'folder_path'.
 
     In `live_mode` will process only 20 newest files, and the search for new files again.
     If not live mode, it will start with oldest files first, and process all then quit.
+    With 'parse_workers' above one, files are parsed in that many subprocesses, while 'upload_workers' threads upload.
+    With 'chunk_rows', files are instead streamed in chunks of that many rows. With a 'spool', requests are kept on
+    disk until uploaded. Outside of live mode, a 'checkpoint' lets the extraction resume where it stopped. With
+    'leases', only files claimed by this extractor are processed, so several can share the folder. With 'last_values',
+    datapoints already uploaded, or unchanged within its deadband, are dropped.
     """
-    while True:
-        if live_mode:
-            files = find_live_files_in_path(folder_path)
-        else:
-            files = find_historical_files_in_path(folder_path, time_from, time_until)
-
-        logger.info("Found {} relevant files to process in {}".format(len(files), folder_path))
-        monitor.available_csv_files_gauge.set(len(files))
-        monitor.push()
-
-        if files:
-            process_files(client, monitor, files, time_series_cache, failed_path, finished_path)
-
-        if live_mode:
-            time.sleep(8)
-        else:
-            logger.info("Extraction complete")
-            break
-
-
-def get_all_time_series(client):
-    """Return map of time series externalId -> name of all time series that has externalId."""
-    for i in range(10):
-        try:
-            res = client.time_series.list(include_metadata=True, limit=-1)
-        except CogniteAPIError as exc:
-            logger.error("Failed to get timeseries: {!s}".format(exc))
-            time.sleep(i)
-        else:
-            break
-    else:
-        logger.fatal("Could not fetch time series data from CDP, exiting!")
-        sys.exit(1)
-
-    return {r.external_id: r.name for r in res}  # expected any time-series has external ID (not in metadata)
-
-
-def _log_error(func, *args, **vargs):
-    """Call 'func' with args, then log if an exception was raised."""
+    uploader = Uploader(client, upload_workers, monitor=monitor, spool=spool)
+    index = FileIndex(folder_path)
     try:
-        return func(*args, **vargs)
-    except Exception as error:
-        logger.info(error)
-
-
-def _log_error_with_backup_for_datapoints(func, csv_path, failed_path, *args, **vargs):
-    """Call 'func' with args, then log if an exception was raised."""
-    try:
-        return func(*args, **vargs)
-    except Exception as error:
-        logger.info(error)
-        try:
-            if failed_path and not failed_path.joinpath(csv_path.name).exists():
-                csv_path.replace(failed_path.joinpath(csv_path.name))
-                logger.info("File {!s} is replaced to failed folder".format(csv_path.name))
-        except IOError as exc:
-            logger.debug("Failed to replace file {}: {!s}".format(csv_path.name, exc))
-
-
-def create_data_points(values, timestamps):
-    """Return list of tuples (ts, value), because next function gets that format, not Datapoint"""
-    data_points = []
-
-    for i, value_string in enumerate(values):
-        if value_string:
-            try:
-                value = float(value_string.replace(",", "."))
-            except ValueError as error:
-                logger.info(error)
-                continue
-            data_points.append((int(timestamps[i]) * 1000, value))
-    return data_points
-
-
-def create_time_series(client, name: str, external_id: str) -> None:
-    """Create a new time series when the 'external_id' isn't found."""
-    new_time_series = TimeSeries(
-        name=name, description="Auto-generated time series, external ID not found", external_id=external_id
-    )
-    _log_error(client.time_series.create, new_time_series)
-
-
-def get_parsed_file(path) -> Dict[str, list]:
-    """Parse the csv file and return the data in a {col_name -> list_of_row_items} dictionary"""
-    parsed_file = defaultdict(list)
-    with open(path, "r", encoding="latin-1") as f:
-        data = csv.DictReader(f, delimiter=";")
-        for row in data:
-            for k, v in row.items():
-                parsed_file[k].append(v)
-    return parsed_file
-
+        while True:
+            with monitor.discovery_histogram.time():
+                if live_mode:
+                    files = index.newest()
+                else:
+                    files = index.historical(time_from, time_until)
+
+            logger.info("Found {} relevant files to process in {}".format(len(files), folder_path))
+            monitor.available_csv_files_gauge.set(len(files))
+            monitor.push()
+
+            if files:
+                process_files(
+                    client,
+                    monitor,
+                    files,
+                    time_series_cache,
+                    failed_path,
+                    finished_path,
+                    parse_workers,
+                    uploader,
+                    chunk_rows,
+                    None if live_mode else checkpoint,
+                    leases,
+                    last_values,
+                )
 
-def process_csv_file(client, monitor, csv_path, existing_time_series, failed_path):
+            if live_mode:
+                time.sleep(8)
+            else:
+                logger.info("Extraction complete")
+                break
+    finally:
+        uploader.stop()
+
+
+def check_time_series(monitor, time_series_cache, schema) -> None:
+    """Create the time series of 'schema' missing in CDF, and mark the schema as checked if all exist."""
+    checked_at = time.time()
+    names = schema.names
+    missing_names = {ext_id: names[ext_id] for ext_id in time_series_cache.lookup(names)}
+    created = time_series_cache.create(missing_names) if missing_names else 0
+    monitor.incr_created_time_series_counter(created)
+    if created == len(missing_names):
+        schema.checked_at = checked_at
+
+
+def process_csv_file(client, monitor, batcher, job, time_series_cache, parsed_file=None, uploaded=None):
+    """Add the datapoints of the csv file of 'job' to 'batcher'.
+
+    'parsed_file' is the parsed file or an iterable of parsed chunks of it, by default the file is parsed here. The
+    chunks of a zip archive may be from csv files with different headers.
+    Datapoints inside the (first, last) time ranges in 'uploaded' of their externalId, if any, are skipped as already
+    uploaded from this file.
+    """
     start_time = time.time()
 
-    parsed_file = get_parsed_file(csv_path)
-    timestamps = parsed_file[""][1:]  # ignore garbage value in first line
-    del parsed_file[""]  # remove the timestamps from the dictionary
+    if parsed_file is None:
+        parsed_file = parse_csv_file(job.path)
+    chunks = [parsed_file] if isinstance(parsed_file, ParsedFile) else parsed_file
 
+    schema = None
+    fingerprint = None
     count_of_data_points = 0
+    rejected_cells = 0
     unique_external_ids = set()  # Count number of time series processed
-    current_time_series = []  # List of time series being processed
-    network_threads = []
-    for col_name, v in parsed_file.items():
-        if len(current_time_series) >= 1000:
-            network_threads.append(
-                threading.Thread(
-                    target=_log_error_with_backup_for_datapoints,
-                    args=(client.datapoints.insert_multiple, csv_path, failed_path, current_time_series.copy()),
-                )
-            )
-
-            current_time_series.clear()
-
-        name = col_name.rpartition(":")[2].strip()
-        external_id = col_name.rpartition(":")[0].strip()
-
-        if external_id not in existing_time_series:
-            create_time_series(client, name, external_id)
-            existing_time_series[external_id] = name
-            monitor.incr_created_time_series_counter()
-
-        data_points = create_data_points(v[1:], timestamps)
-        if data_points:
-            current_time_series.append({"externalId": external_id, "datapoints": data_points})
-            count_of_data_points += len(data_points)
-            unique_external_ids.add(external_id)
-
-    if current_time_series:
-        network_threads.append(
-            threading.Thread(
-                target=_log_error_with_backup_for_datapoints,
-                args=(client.datapoints.insert_multiple, csv_path, failed_path, current_time_series.copy()),
-            )
+    for chunk in chunks:
+        if chunk.fingerprint != fingerprint:
+            fingerprint = chunk.fingerprint
+            schema, cached = time_series_cache.schemas.get(chunk.fingerprint, chunk.column_names)
+            monitor.incr_schema_cache_counter(cached)
+            if schema.checked_at < time.time() - time_series_cache.ttl:
+                with monitor.time_series_creation_histogram.time():
+                    check_time_series(monitor, time_series_cache, schema)
+
+        monitor.parse_histogram.observe(chunk.parse_seconds)
+        conversion_start_time = time.perf_counter()
+        timestamps = chunk.timestamps * 1000
+        rejected_cells += int(chunk.rejected.sum())
+        for col, external_id, _ in schema.classify(chunk.valid, chunk.rejected):
+            valid = chunk.valid[col]
+            if uploaded and external_id in uploaded:
+                for first, last in uploaded[external_id]:
+                    valid = valid & ((timestamps < first) | (timestamps > last))
+            data_points = DataPoints.from_column(timestamps, chunk.values[col], valid)
+            if len(data_points):
+                latest = int(data_points.timestamps.max())
+                job.watermarks[external_id] = max(latest, job.watermarks.get(external_id, -1))
+                batcher.add(job, external_id, data_points)
+                count_of_data_points += len(data_points)
+                unique_external_ids.add(external_id)
+        monitor.conversion_histogram.observe(time.perf_counter() - conversion_start_time)
+
+    if rejected_cells:
+        monitor.rejected_cells_counter.inc(rejected_cells)
+        logger.info("Skipped {} cells that are not numbers in {}".format(rejected_cells, job.path))
+    logger.info("Time to process file {}: {:.2f} seconds".format(job.path, time.time() - start_time))
+
+    return count_of_data_points, len(unique_external_ids)
+
+
+def finish_file(monitor, failed_path, finished_path, job) -> None:
+    """Move the file of 'job' to 'failed_path' if an upload failed, else delete it or move it to 'finished_path'."""
+    with monitor.file_move_histogram.time():
+        _finish_file(monitor, failed_path, finished_path, job)
+
+
+def _finish_file(monitor, failed_path, finished_path, job) -> None:
+    path = job.path
+    try:
+        if not path.exists():
+            return
+        if job.failed and failed_path is not None:
+            monitor.incr_failed_files_counter()
+            if not failed_path.joinpath(path.name).exists():
+                path.replace(failed_path.joinpath(path.name))
+                logger.info("File {!s} is replaced to failed folder".format(path.name))
+            return
+        if finished_path is None:
+            path.unlink()
+        else:
+            path.replace(finished_path.joinpath(path.name))
+    except IOError as exc:
+        logger.debug("Unable to delete file {}: {!s}".format(path, exc))
+
+
+def flush_window(batcher, window) -> None:
+    """Submit the datapoints collected for the files in 'window', and seal them so they finish when uploaded."""
+    batcher.flush()
+    for job in window:
+        job.seal()
+    window.clear()
+
+
+def handle_parsed_file(
+    client,
+    monitor,
+    batcher,
+    window,
+    job,
+    time_series_cache,
+    failed_path,
+    parsed_file,
+    parse_error=None,
+    uploaded=None,
+) -> None:
+    """Add the datapoints of the parsed file of 'job' to 'batcher', or move the file to 'failed_path' if it failed.
+
+    The datapoints of a failed file not yet submitted, as from earlier chunks, are dropped from 'batcher'.
+    """
+    path = job.path
+    try:
+        if parse_error is not None:
+            raise parse_error
+        data_points_count, time_series_count = process_csv_file(
+            client, monitor, batcher, job, time_series_cache, parsed_file, uploaded
         )
+    except FileNotFoundError as exc:
+        logger.debug("Unable to open file {}: {!s}".format(path, exc))
+        batcher.discard(job)
+    except Exception as exc:
+        logger.error("Parsing of file {} failed: {!s}".format(path, exc), exc_info=exc)
+        batcher.discard(job)
+        monitor.incr_failed_files_counter()
 
-    logger.info("Time to process file {}: {:.2f} seconds".format(csv_path, time.time() - start_time))
-
-    return network_threads, count_of_data_points, len(unique_external_ids)
-
-
-def post_all_data(queue, monitor, finished_path):
-    start_time = time.time()
-
-    all_threads = list(chain(*map(itemgetter(0), queue)))
-    for thread in all_threads:
-        thread.start()
-    for thread in all_threads:
-        thread.join()
-
-    for path in map(itemgetter(1), queue):
-        try:
-            if path.exists():
-                if finished_path is None:
-                    path.unlink()
-                else:
-                    path.replace(finished_path.joinpath(path.name))
-        except IOError as exc:
-            logger.debug("Unable to delete file {}: {!s}".format(path, exc))
-
-    monitor.incr_total_data_points_counter(sum(map(itemgetter(2), queue)))
+        if failed_path is not None:
+            path.replace(failed_path.joinpath(path.name))
 
-    logger.info("Total time to send batch of request: {:.2f} seconds".format(time.time() - start_time))
-
-
-def process_files(client, monitor, paths, time_series_cache, failed_path, finished_path) -> None:
-    """Process one csv file at a time, and either delete it or move it when done."""
+    else:
+        window.append(job)
+        monitor.successfully_processed_files_gauge.inc()
+        monitor.count_of_time_series_gauge.set(time_series_count)
+
+        if len(window) >= FILE_WINDOW:
+            flush_window(batcher, window)
+
+
+def process_files(
+    client,
+    monitor,
+    paths,
+    time_series_cache,
+    failed_path,
+    finished_path,
+    parse_workers: int = 1,
+    uploader: Uploader = None,
+    chunk_rows: int = None,
+    checkpoint=None,
+    leases=None,
+    last_values=None,
+) -> None:
+    """Process one csv file at a time, and either delete it or move it when all its datapoints are uploaded.
+
+    Files may be parsed ahead in 'parse_workers' subprocesses, but are handled here in the order of 'paths'. Datapoints
+    of up to FILE_WINDOW files are batched together. Without a long-lived 'uploader', one is started for these files.
+    With 'chunk_rows', files are streamed in chunks of that many rows, and only finished when all chunks are uploaded.
+    With a 'checkpoint', files finished by an earlier run are not processed again, and of files it started only the
+    datapoints not acknowledged by CDF before are uploaded. With 'leases', files are claimed just before they are
+    parsed, and files claimed by other extractors are skipped. With 'last_values', datapoints already added are
+    dropped, and forgotten again if their file fails.
+    """
     monitor.successfully_processed_files_gauge.set(0)
     monitor.unprocessed_files_gauge.set(len(paths))
-    thread_queue = []
     start_time = time.time()
-
-    for path in paths:
-        try:
-            threads, data_points_count, time_series_count = process_csv_file(
-                client, monitor, path, time_series_cache, failed_path
-            )
-            thread_queue.append((threads, path, data_points_count))
-        except IOError as exc:
-            logger.debug("Unable to open file {}: {!s}".format(path, exc))
-        except Exception as exc:
-            logger.error("Parsing of file {} failed: {!s}".format(path, exc), exc_info=exc)
-            monitor.incr_failed_files_counter()
-
-            if failed_path is not None:
-                path.replace(failed_path.joinpath(path.name))
-
-        else:
-            monitor.successfully_processed_files_gauge.inc()
-            monitor.count_of_time_series_gauge.set(time_series_count)
-
-            if len(thread_queue) >= 20:
-                post_all_data(thread_queue, monitor, finished_path)
-                thread_queue.clear()
-
+    own_uploader = uploader is None
+    if own_uploader:
+        uploader = Uploader(client, monitor=monitor)
+    batcher = DatapointBatcher(uploader, last_values=last_values)
+    window = []
+
+    statuses = {} if checkpoint is None else {path: checkpoint.file_status(path) for path in paths}
+
+    def on_done(job):
+        if last_values is not None and job.failed:
+            last_values.forget(job.watermarks)
+        if checkpoint is not None:
+            checkpoint.done(job)
+        finish_file(monitor, failed_path, finished_path, job)
+        if leases is not None:
+            leases.release(job.path)
+
+    def paths_to_parse():
+        for path in paths:
+            if leases is not None and not leases.claim(path):
+                logger.debug("File {!s} is claimed by another extractor".format(path.name))
+            elif statuses.get(path) == FINISHED:
+                logger.info("File {!s} is already uploaded".format(path.name))
+                on_done(FileJob(path))
+            else:
+                yield path
+                continue
+            monitor.unprocessed_files_gauge.dec()
+
+    for path, parsed_file, parse_error in iter_parsed_files(paths_to_parse(), parse_workers, chunk_rows):
+        job = FileJob(path, on_done)
+        uploaded = None
+        if checkpoint is not None:
+            job.on_uploaded = checkpoint.uploaded
+            resumed = statuses[path] == STARTED
+            if resumed:
+                logger.info("Resuming file {!s}, skipping the datapoints already uploaded".format(path.name))
+                uploaded = checkpoint.progress(path)
+            checkpoint.start(job, resumed)
+        handle_parsed_file(
+            client, monitor, batcher, window, job, time_series_cache, failed_path, parsed_file, parse_error, uploaded
+        )
+        if job not in window:  # Failed, the file is not finished by the uploader
+            job.failed = True
+            if last_values is not None:
+                last_values.forget(job.watermarks)
+            if checkpoint is not None:
+                checkpoint.done(job)
+            if leases is not None:
+                leases.release(path)
         monitor.unprocessed_files_gauge.dec()
         monitor.push()
 
-    if thread_queue:
-        post_all_data(thread_queue, monitor, finished_path)
-        monitor.push()
+    flush_window(batcher, window)
+    uploader.join()
+    if own_uploader:
+        uploader.stop()
+    monitor.push()
 
     logger.info("Total time to process {} of files: {:.2f} seconds".format(len(paths), time.time() - start_time))
 
 
 def find_historical_files_in_path(folder_path, time_from, time_until):
-    all_paths = list(folder_path.glob("*.csv"))
-
-    if time_from or time_until:
-        all_relevant_paths = []
-        for path in all_paths:
-            filename_parts = path.stem.split("_")
-            if len(filename_parts) > 2:
-                try:
-                    timestamp = int(filename_parts[-1])
-                except ValueError as exc:
-                    logger.warning("Failed to find timestamp in {}, skipping! {!s}".format(path.name, exc))
-                else:
-                    if (not time_from or time_from < timestamp) and (not time_until or timestamp < time_until):
-                        all_relevant_paths.append(path)
-        all_paths = all_relevant_paths
-    
-    """Sort files by timestamp. Files without timestamp postfix defaults to timestamp=0"""
-    splitted_path_lst = [path.stem.split("_") for path in all_paths]
-    timestamp_lst = [int(parts[-1]) if len(parts) > 2 else 0 for parts in splitted_path_lst]
-    zipped = zip(timestamp_lst, all_paths)
-    sorted_paths = [i[1] for i in sorted(zipped, key=itemgetter(0))]
-    
-    return sorted_paths
+    """Return csv files in 'folder_path' sorted by the timestamp postfix of their names, between the times if given."""
+    return FileIndex(folder_path).historical(time_from, time_until)
 
 
 def find_live_files_in_path(folder_path):
     """Return max 20 csv files in 'folder_path' sorted by newest first on last modified timestamp of files."""
-    before_timestamp = time.time() - 1.0  # Only process files older than 1 seconds
-    all_relevant_paths = []
-
-    for path in folder_path.glob("*.csv"):
-        try:
-            modified_timestamp = path.stat().st_mtime
-        except IOError as exc:  # Possible that file no longer exists, multiple extractors
-            logger.debug("Failed to find stats on file {!s}: {!s}".format(path, exc))
-            continue
-        if modified_timestamp < before_timestamp:
-            all_relevant_paths.append((path, modified_timestamp))
-
-    # We only process 20 newest before we look again for live
-    return [p for p, _ in sorted(all_relevant_paths, key=itemgetter(1), reverse=True)][:20]
+    return FileIndex(folder_path).newest()
@@ -0,0 +1,261 @@
+# coding: utf-8
+"""
+A module for parsing Tebis CSV files into columnar arrays.
+"""
+import csv
+import gzip
+import hashlib
+import io
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, List, NamedTuple, Optional, TextIO, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+try:
+    import zstandard
+except ImportError:  # Optional, only needed to read .zst files
+    zstandard = None
+
+DELIMITER = ";"
+QUOTECHAR = '"'
+ENCODING = "latin-1"
+CSV_SUFFIXES = (".csv", ".csv.gz", ".zip") + ((".csv.zst",) if zstandard else ())  # zip archives hold csv files
+STEM_SUFFIXES = (".csv.gz", ".csv.zst", ".csv.zip", ".csv", ".zip")
+
+
+class ParsedFile(NamedTuple):
+    """Columnar content of a csv file.
+
+    'timestamps' holds the first column in seconds, 'values' holds one row per value column (so each time series is a
+    contiguous array) and 'valid' marks which cells held a finite number. 'rejected' counts the cells per value column
+    that were not empty, but held no number. Files with the same header line have the same 'fingerprint'.
+    'parse_seconds' is the time it took to parse.
+    """
+
+    column_names: List[str]
+    fingerprint: str
+    timestamps: np.ndarray
+    values: np.ndarray
+    valid: np.ndarray
+    rejected: np.ndarray
+    parse_seconds: float = 0.0
+
+
+def csv_stem(name: str) -> str:
+    """Return the file name without its csv and compression suffixes, like 'TEBIS_FK_1550092560'."""
+    for suffix in STEM_SUFFIXES:
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    return name
+
+
+def is_csv_file_name(name: str) -> bool:
+    """Return whether 'name' is a csv file, a compressed csv file or a zip archive of csv files that can be read."""
+    return name.endswith(CSV_SUFFIXES)
+
+
+def iter_csv_streams(path) -> Iterator[TextIO]:
+    """Yield a text stream of each csv file in 'path', decompressing while read if compressed.
+
+    A zip archive yields each csv file in it, others yield just one stream.
+    """
+    name = str(path)
+    if name.endswith(".zip"):
+        with zipfile.ZipFile(name) as archive:
+            for member in archive.infolist():
+                if member.filename.endswith(".csv"):
+                    with archive.open(member) as f:
+                        yield io.TextIOWrapper(f, encoding=ENCODING, newline="")
+        return
+
+    if name.endswith(".gz"):
+        f = gzip.open(name, "rt", encoding=ENCODING, newline="")
+    elif name.endswith(".zst"):
+        if zstandard is None:
+            raise ValueError("Install zstandard to read {}".format(name))
+        reader = zstandard.ZstdDecompressor().stream_reader(open(name, "rb"), closefd=True)
+        f = io.TextIOWrapper(reader, encoding=ENCODING, newline="")
+    else:
+        f = open(name, "r", encoding=ENCODING, newline="")
+    with f:
+        yield f
+
+
+def _read_header(f) -> Tuple[List[str], str]:
+    """Return the column names of the first line and its fingerprint, the second line holds units and is skipped."""
+    line = f.readline()
+    header = next(csv.reader([line], delimiter=DELIMITER, quotechar=QUOTECHAR))
+    f.readline()
+    return header, hashlib.blake2b(line.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _text_to_float(text: pd.Series, decimal_comma: bool = True) -> np.ndarray:
+    if decimal_comma:
+        text = text.str.replace(",", ".", regex=False)
+    return pd.to_numeric(text, errors="coerce").to_numpy(dtype=np.float64)
+
+
+def _to_float_columns(frame: pd.DataFrame, decimal_comma: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the columns of 'frame' as rows of floats, converting columns the C parser left as text to float.
+
+    Also return the number of cells per column that held text which is not a number, as those become NaN. All text
+    columns are converted in one pass, once per distinct text if texts repeat, like in status columns. Without
+    'decimal_comma', text is expected to have decimal points only.
+    """
+    columns = np.empty((len(frame.columns), len(frame)), dtype=np.float64)
+    rejected = np.zeros(len(frame.columns), dtype=np.int64)
+    is_text = np.array([dtype.kind not in "fiu" for dtype in frame.dtypes], dtype=bool)
+    if not is_text.all():
+        columns[~is_text] = frame.iloc[:, ~is_text].to_numpy(dtype=np.float64).T
+    if not is_text.any():
+        return columns, rejected
+
+    cells = frame.iloc[:, is_text].to_numpy(dtype=object).ravel(order="F")  # One text column after the other
+    codes, uniques = pd.factorize(cells)
+    if 2 * len(uniques) < len(codes):  # Code -1 is empty, appended as NaN
+        values = np.append(_text_to_float(pd.Series(uniques, dtype=object), decimal_comma), np.nan)[codes]
+    else:
+        values = _text_to_float(pd.Series(cells, dtype=object), decimal_comma)
+    columns[is_text] = values.reshape(-1, len(frame))
+    not_empty = np.count_nonzero((codes >= 0).reshape(-1, len(frame)), axis=1)
+    rejected[is_text] = not_empty - np.count_nonzero(~np.isnan(columns[is_text]), axis=1)
+    return columns, rejected
+
+
+def _read_columns_as_one(text: str, width: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """Return the rows of 'text' as 'width' columns of floats and the rejected cells per column, like _to_float_columns.
+
+    The cells are parsed as one long column, as on wide files with few rows the C parser spends most of its time per
+    column. Decimal commas are replaced once in the whole text. Returns None for text with quotes or rows of another
+    width, which are left to pd.read_csv.
+    """
+    text = text.replace("\r\n", "\n")
+    if QUOTECHAR in text or "\r" in text:
+        return None
+    lines = [line for line in text.split("\n") if line]
+    if not lines or any(line.count(DELIMITER) != width - 1 for line in lines):
+        return None
+    cells = "\n".join(lines).replace(DELIMITER, "\n").replace(",", ".")
+    frame = pd.read_csv(io.StringIO(cells), sep=DELIMITER, header=None, names=[0], skip_blank_lines=False)
+    values = np.full(len(lines) * width, np.nan)
+    not_empty = np.zeros(len(lines) * width, dtype=bool)
+    values[: len(frame)] = _to_float_columns(frame, decimal_comma=False)[0][0]  # The parser drops an empty last cell
+    not_empty[: len(frame)] = frame[0].notna().to_numpy()
+    columns = np.ascontiguousarray(values.reshape(len(lines), width).T)
+    rejected = np.count_nonzero((not_empty & np.isnan(values)).reshape(len(lines), width), axis=0)
+    return columns, rejected
+
+
+def _read_csv_options(header: List[str]) -> dict:
+    return dict(
+        sep=DELIMITER,
+        quotechar=QUOTECHAR,
+        decimal=",",
+        header=None,
+        names=range(len(header)),
+        index_col=False,
+        skip_blank_lines=True,
+    )
+
+
+def _to_parsed_file(path, header: List[str], fingerprint: str, frame: pd.DataFrame, start_time: float) -> ParsedFile:
+    columns, rejected = _to_float_columns(frame)
+    return _columns_to_parsed_file(path, header, fingerprint, columns, rejected, start_time)
+
+
+def _columns_to_parsed_file(path, header, fingerprint, columns: np.ndarray, rejected: np.ndarray, start_time):
+    if np.isnan(columns[0]).any():
+        raise ValueError("Invalid timestamp in first column of {!s}".format(path))
+
+    timestamps = columns[0].astype(np.int64)
+    values = columns[1:]
+    parse_seconds = time.perf_counter() - start_time
+    return ParsedFile(header[1:], fingerprint, timestamps, values, np.isfinite(values), rejected[1:], parse_seconds)
+
+
+def parse_csv_file(path) -> Union[ParsedFile, List[ParsedFile]]:
+    """Parse the csv file in one pass into typed arrays, without creating a Python object per cell.
+
+    A zip archive of several csv files is parsed into a list with one ParsedFile per csv file.
+    """
+    parsed_files = []
+    for f in iter_csv_streams(path):
+        start_time = time.perf_counter()
+        header, fingerprint = _read_header(f)
+        text = f.read()
+        read = _read_columns_as_one(text, len(header))
+        if read is not None:
+            parsed_files.append(_columns_to_parsed_file(path, header, fingerprint, *read, start_time))
+        else:
+            frame = pd.read_csv(io.StringIO(text), **_read_csv_options(header))
+            parsed_files.append(_to_parsed_file(path, header, fingerprint, frame, start_time))
+    if not parsed_files:
+        raise ValueError("No csv file in {!s}".format(path))
+    return parsed_files[0] if len(parsed_files) == 1 else parsed_files
+
+
+def iter_csv_chunks(path, chunk_rows: int) -> Iterator[ParsedFile]:
+    """Parse the csv file lazily, 'chunk_rows' rows at a time, so memory is bounded regardless of the file size.
+
+    Each chunk has the header of the csv file it is from. An uncompressed file is memory mapped rather than read into
+    buffers.
+    """
+    for f in iter_csv_streams(path):
+        start_time = time.perf_counter()
+        header, fingerprint = _read_header(f)
+        if str(path).endswith(".csv"):
+            source = dict(filepath_or_buffer=str(path), encoding=ENCODING, skiprows=2, memory_map=True)
+        else:
+            source = dict(filepath_or_buffer=f)
+
+        reader = pd.read_csv(chunksize=chunk_rows, **source, **_read_csv_options(header))
+        try:
+            for frame in reader:
+                yield _to_parsed_file(path, header, fingerprint, frame, start_time)
+                start_time = time.perf_counter()
+        finally:
+            reader.close()
+
+
+def parse_csv_file_or_error(path) -> Tuple[Union[ParsedFile, List[ParsedFile], None], Optional[Exception]]:
+    """Parse 'path', returning the exception instead of raising it so it can be handled per file by the caller."""
+    try:
+        return parse_csv_file(path), None
+    except Exception as exc:
+        return None, exc
+
+
+def iter_parsed_files(paths: Iterable, workers: int = 1, chunk_rows: int = None) -> Iterator[Tuple]:
+    """Yield (path, parsed_file, error) in the order of 'paths'.
+
+    With more than one worker the files are parsed in a process pool, keeping at most two files per worker in flight so
+    memory stays bounded while the caller consumes the results. With 'chunk_rows', parsed_file is a lazy iterator of
+    chunks, parsed by the caller while consuming it.
+    """
+    if chunk_rows:
+        for path in paths:
+            yield path, iter_csv_chunks(path, chunk_rows), None
+        return
+
+    if workers <= 1:
+        for path in paths:
+            yield (path,) + parse_csv_file_or_error(path)
+        return
+
+    paths = iter(paths)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque((path, executor.submit(parse_csv_file_or_error, path)) for path in islice(paths, workers * 2))
+        while pending:
+            path, future = pending.popleft()
+            for next_path in islice(paths, 1):
+                pending.append((next_path, executor.submit(parse_csv_file_or_error, next_path)))
+            try:
+                result = future.result()
+            except Exception as exc:  # Worker died or result could not be transferred
+                result = None, exc
+            yield (path,) + result
@@ -0,0 +1,134 @@
+# coding: utf-8
+"""
+A module for finding csv files to process in large folders.
+"""
+import heapq
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Collection, List, Optional
+
+from csv_parser import csv_stem, is_csv_file_name
+
+logger = logging.getLogger(__name__)
+
+LIVE_FILES_MAX = 20  # Number of newest files returned in live mode
+SETTLE_SECONDS = 1.0  # Only process files not modified for this long, as they may still be written
+
+
+def filename_timestamp(name: str) -> Optional[int]:
+    """Return the timestamp postfix of a file named like 'TEBIS_FK_1550092560.csv.gz', or None if it has none."""
+    parts = csv_stem(name).split("_")
+    if len(parts) > 2:
+        try:
+            return int(parts[-1])
+        except ValueError:
+            logger.warning("Failed to find timestamp in {}".format(name))
+    return None
+
+
+class FileIndex:
+    """Index of the csv files in 'folder_path', updated with the files added and removed since the last scan.
+
+    Compressed csv files and zip archives count as csv files. Only new files are stat'ed and have their name parsed. The
+    folder is not listed again while its modification time is unchanged, except for files that were still being written
+    at the last scan. The newest files are kept in a heap on modification time, from which entries of removed or
+    modified files are dropped when they surface.
+    """
+
+    def __init__(self, folder_path):
+        self.folder_path = Path(folder_path)
+        self._entries = {}  # name -> (filename timestamp, modification time)
+        self._newest = []  # heap of (-modification time, name)
+        self._unsettled = set()  # names of files modified less than SETTLE_SECONDS before last scan
+        self._folder_mtime_ns = None
+        self._scanned_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def refresh(self) -> None:
+        """Update the index with the files added, removed and still being written since the last call."""
+        now = time.time()
+        for name in list(self._unsettled):
+            self._add(name, now)
+
+        try:
+            folder_mtime_ns = os.stat(str(self.folder_path)).st_mtime_ns
+        except OSError as exc:
+            logger.error("Failed to find stats on folder {!s}: {!s}".format(self.folder_path, exc))
+            return
+        # Files added within the timestamp resolution of the folder after it was listed don't change its mtime
+        if folder_mtime_ns == self._folder_mtime_ns and self._scanned_at - folder_mtime_ns / 1e9 > SETTLE_SECONDS:
+            return
+
+        with os.scandir(str(self.folder_path)) as entries:
+            names = {entry.name for entry in entries if is_csv_file_name(entry.name) and entry.is_file()}
+        for name in self._entries.keys() - names:
+            del self._entries[name]
+            self._unsettled.discard(name)
+        for name in names - self._entries.keys():
+            self._add(name, now)
+        if len(self._newest) > 2 * len(self._entries) + LIVE_FILES_MAX:  # Drop entries of removed and modified files
+            self._newest = [(-mtime, name) for name, (_, mtime) in self._entries.items()]
+            heapq.heapify(self._newest)
+        self._folder_mtime_ns = folder_mtime_ns
+        self._scanned_at = now
+
+    def historical(self, time_from=None, time_until=None) -> List[Path]:
+        """Return the files sorted by their timestamp postfix, between 'time_from' and 'time_until' if given.
+
+        Files without a timestamp postfix sort first, but are left out if 'time_from' or 'time_until' is given.
+        """
+        self.refresh()
+        items = []
+        for name, (timestamp, _) in self._entries.items():
+            if time_from or time_until:
+                if timestamp is None:
+                    continue
+                if (time_from and timestamp <= time_from) or (time_until and time_until <= timestamp):
+                    continue
+            items.append((timestamp or 0, name))
+        return [self.folder_path.joinpath(name) for _, name in sorted(items)]
+
+    def newest(self, count: int = LIVE_FILES_MAX, skip: Collection[Path] = ()) -> List[Path]:
+        """Return the 'count' most recently modified files, newest first, leaving out files still being written.
+
+        Files in 'skip', like those already queued, are left out too, so older files are returned instead.
+        """
+        self.refresh()
+        before_timestamp = time.time() - SETTLE_SECONDS
+        found = []
+        skipped = []
+        while self._newest and len(found) < count:
+            item = heapq.heappop(self._newest)
+            entry = self._entries.get(item[1])
+            if entry is None or entry[1] != -item[0]:  # Removed or modified since pushed
+                continue
+            if -item[0] < before_timestamp and self.folder_path.joinpath(item[1]) not in skip:
+                found.append(item)
+            else:
+                skipped.append(item)
+        for item in found + skipped:
+            heapq.heappush(self._newest, item)
+        return [self.folder_path.joinpath(name) for _, name in found]
+
+    def _add(self, name: str, now: float) -> None:
+        try:
+            modified_timestamp = os.stat(str(self.folder_path.joinpath(name))).st_mtime
+        except OSError as exc:  # Possible that file no longer exists, multiple extractors
+            logger.debug("Failed to find stats on file {}: {!s}".format(name, exc))
+            self._entries.pop(name, None)
+            self._unsettled.discard(name)
+            return
+
+        entry = self._entries.get(name)
+        if entry is None or entry[1] != modified_timestamp:
+            timestamp = filename_timestamp(name) if entry is None else entry[0]
+            self._entries[name] = (timestamp, modified_timestamp)
+            heapq.heappush(self._newest, (-modified_timestamp, name))
+        if now - modified_timestamp < SETTLE_SECONDS:
+            self._unsettled.add(name)
+        else:
+            self._unsettled.discard(name)
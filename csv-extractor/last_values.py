@@ -0,0 +1,99 @@
+# coding: utf-8
+"""
+A module for suppressing datapoints that were already uploaded or did not change.
+"""
+import threading
+from collections import OrderedDict
+from typing import Iterable
+
+import numpy as np
+
+from payload import DataPoints
+
+LAST_VALUES_MAX = 100000  # Number of time series to remember the last datapoints of
+
+
+class LastValueCache:
+    """Drop datapoints already added for a time series, and if 'deadband' is given, values that did not change.
+
+    For each of the 'max_size' most recently used externalIds it keeps the time range of the datapoints added, merged
+    while ranges overlap, and the last value kept. Datapoints inside the range were added before, as when files repeat
+    boundary rows or a time window is exported again, and are dropped. Datapoints after the range are dropped if their
+    value differs at most 'deadband' from the last value kept. Suppressed datapoints are counted in 'monitor' if given.
+    """
+
+    def __init__(self, max_size: int = LAST_VALUES_MAX, deadband: float = None, monitor=None):
+        self.max_size = max_size
+        self.deadband = deadband
+        self.monitor = monitor
+        self._entries = OrderedDict()  # externalId -> (first timestamp, last timestamp, last value)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def filter(self, external_id: str, data_points: DataPoints) -> DataPoints:
+        """Return the datapoints to upload of 'data_points', which are sorted on time, and remember them as added."""
+        if not len(data_points):
+            return data_points
+        timestamps, values = data_points.timestamps, data_points.values
+        with self._lock:
+            entry = self._entries.get(external_id)
+            if entry is not None:
+                self._entries.move_to_end(external_id)
+
+        if entry is None:
+            first, last, last_value = timestamps[0], timestamps[-1], None
+            keep = np.ones(len(timestamps), dtype=bool)
+            after = keep.copy()
+        else:
+            first, last, last_value = entry
+            after = timestamps > last
+            keep = after | (timestamps < first)
+        duplicates = len(timestamps) - np.count_nonzero(keep)
+
+        suppressed = 0
+        if self.deadband is not None and after.any():
+            changed = self._changed(values[after], last_value)
+            suppressed = len(changed) - np.count_nonzero(changed)
+            keep[after] = changed
+            after = after & keep
+        if after.any():
+            last_value = values[after][-1]
+
+        if entry is None or (timestamps[0] <= last and timestamps[-1] >= first):
+            entry = (min(first, timestamps[0]), max(last, timestamps[-1]), last_value)
+        elif timestamps[0] > last:  # Newer than the range, without overlapping it
+            entry = (timestamps[0], timestamps[-1], last_value)
+        with self._lock:
+            self._entries[external_id] = entry
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+        if self.monitor is not None:
+            if duplicates:
+                self.monitor.duplicate_data_points_counter.inc(duplicates)
+            if suppressed:
+                self.monitor.deadband_data_points_counter.inc(suppressed)
+        if duplicates or suppressed:
+            return DataPoints.from_column(timestamps, values, keep)
+        return data_points
+
+    def forget(self, external_ids: Iterable[str]) -> None:
+        """Forget the datapoints added for 'external_ids', as they failed to upload."""
+        with self._lock:
+            for external_id in external_ids:
+                self._entries.pop(external_id, None)
+
+    def _changed(self, values: np.ndarray, last_value) -> np.ndarray:
+        """Mark the values differing more than 'deadband' from the last value kept before them."""
+        if self.deadband == 0:  # The last value kept is the previous value, as only equal values are dropped
+            previous = np.concatenate(([np.nan if last_value is None else last_value], values[:-1]))
+            return values != previous
+
+        changed = np.zeros(len(values), dtype=bool)
+        for i, value in enumerate(values.tolist()):
+            if last_value is None or abs(value - last_value) > self.deadband:
+                changed[i] = True
+                last_value = value
+        return changed
@@ -0,0 +1,142 @@
+# coding: utf-8
+"""
+A module for sharing the files of one input folder between several extractors.
+"""
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+LEASE_FOLDER = ".leases"
+
+
+class LeaseManager:
+    """Claim csv files in 'folder_path' for this extractor through lock files in its '.leases' subfolder.
+
+    A lock file is created with O_CREAT | O_EXCL, so only one extractor can claim a file, and holds the 'instance_id'
+    of its owner. The lease expires 'lease_seconds' after the lock file was last renewed, after which another extractor
+    may take it over, as the owner is assumed to have died. Leases left by an earlier run with the same 'instance_id'
+    are taken back at once. The folder may be shared between nodes, as long as the file system supports exclusive
+    create and atomic rename, like local disks and NFSv3 and later. The leases held are renewed from a background
+    thread until 'stop' is called, so they do not expire while the datapoints of their files are being uploaded.
+    """
+
+    def __init__(self, folder_path, instance_id: str, lease_seconds: float = 300.0):
+        self.folder_path = Path(folder_path, LEASE_FOLDER)
+        self.folder_path.mkdir(parents=True, exist_ok=True)
+        self.instance_id = instance_id
+        self.lease_seconds = lease_seconds
+        self._held = {}  # name -> time renewed
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._renewer = threading.Thread(target=self._renew_periodically, daemon=True)
+        self._renewer.start()
+
+    def __contains__(self, path) -> bool:
+        return path.name in self._held
+
+    def claim(self, path) -> bool:
+        """Return whether this extractor holds the lease of 'path', taking it if free or expired."""
+        if path in self:
+            return True
+        lease_path = self._lease_path(path)
+        if not self._create(lease_path) and not self._adopt(lease_path):
+            if not (self._take_over(lease_path) and self._create(lease_path)):
+                return False
+        if not path.exists():  # Finished by another extractor before we got the lease
+            self.release(path)
+            return False
+        return True
+
+    def release(self, path) -> None:
+        """Give up the lease of 'path', if held."""
+        with self._lock:
+            if self._held.pop(path.name, None) is None:
+                return
+        try:
+            self._lease_path(path).unlink()
+        except OSError as exc:
+            logger.debug("Failed to release lease of {!s}: {!s}".format(path.name, exc))
+
+    def renew(self) -> None:
+        """Renew the leases held that are past a third of their time."""
+        now = time.time()
+        with self._lock:
+            names = [name for name, renewed_at in self._held.items() if now - renewed_at > self.lease_seconds / 3]
+            for name in names:
+                self._held[name] = now
+        for name in names:
+            try:
+                os.utime(str(self.folder_path.joinpath(name + ".lease")))
+            except OSError as exc:
+                logger.warning("Failed to renew lease of {}: {!s}".format(name, exc))
+
+    def stop(self) -> None:
+        """Stop renewing the leases held."""
+        self._stopped.set()
+        self._renewer.join()
+
+    def _renew_periodically(self) -> None:
+        while not self._stopped.wait(self.lease_seconds / 6):
+            self.renew()
+
+    def _lease_path(self, path) -> Path:
+        return self.folder_path.joinpath(path.name + ".lease")
+
+    def _create(self, lease_path) -> bool:
+        try:
+            fd = os.open(str(lease_path), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        try:
+            os.write(fd, self.instance_id.encode("utf-8"))
+        finally:
+            os.close(fd)
+        with self._lock:
+            self._held[lease_path.stem] = time.time()
+        return True
+
+    def _adopt(self, lease_path) -> bool:
+        """Renew the lock file at 'lease_path' if it was left by an earlier run of this extractor."""
+        try:
+            if lease_path.read_text(encoding="utf-8") != self.instance_id:
+                return False
+            os.utime(str(lease_path))
+        except OSError:
+            return False
+        with self._lock:
+            self._held[lease_path.stem] = time.time()
+        return True
+
+    def _take_over(self, lease_path) -> bool:
+        """Remove the lock file at 'lease_path' if its lease has expired, and return whether it was removed."""
+        try:
+            if time.time() - lease_path.stat().st_mtime < self.lease_seconds:
+                return False
+            # Only one extractor succeeds in moving the lock file away
+            stale_path = lease_path.with_name("{}.{}.stale".format(lease_path.name, self.instance_id))
+            lease_path.replace(stale_path)
+        except OSError:  # Released or taken over by another extractor meanwhile
+            return False
+
+        try:
+            if time.time() - stale_path.stat().st_mtime < self.lease_seconds:  # Renewed just before it was moved
+                self._restore(stale_path, lease_path)
+                return False
+            owner = stale_path.read_text(encoding="utf-8")
+            stale_path.unlink()
+        except OSError:
+            return False
+        logger.warning("Took over expired lease of {} from {}".format(lease_path.stem, owner))
+        return True
+
+    def _restore(self, stale_path, lease_path) -> None:
+        """Put the lock file moved away back at 'lease_path', unless another extractor has claimed the file since."""
+        try:
+            os.link(str(stale_path), str(lease_path))  # Unlike a rename, fails if the lease was created again meanwhile
+        except FileExistsError:
+            logger.debug("Lease of {} was claimed again before it could be restored".format(lease_path.stem))
+        stale_path.unlink()
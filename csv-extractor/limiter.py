@@ -0,0 +1,77 @@
+# coding: utf-8
+"""
+A module for adapting the number of concurrent uploads to what CDF accepts.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+THROTTLED_CODES = (429, 503)
+LATENCY_TARGET = 5.0  # Seconds a request may take before it is taken as a sign of overload
+THROTTLED_DECREASE = 0.5  # Factor the limit is cut by when requests are throttled
+LATENCY_DECREASE = 0.9  # Factor the limit is cut by when requests are slow
+
+
+class AdaptiveLimiter:
+    """Limit the number of requests in flight with additive increase and multiplicative decrease (AIMD).
+
+    The limit grows by one for each 'limit' requests answered faster than 'latency_target', so by about one per round
+    trip, up to 'max_limit'. It is halved when a request is throttled, and cut by a tenth when one is slow, at most once
+    per round trip: only requests sent after the last decrease can decrease it again. After a throttled request with
+    a 'retry_after' attribute, no request is sent for that many seconds. Changes are reported to 'monitor' if given.
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1, latency_target: float = LATENCY_TARGET, monitor=None):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.latency_target = latency_target
+        self.monitor = monitor
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self._decreased_at = 0.0
+        self._blocked_until = 0.0
+        self._condition = threading.Condition()
+        self._report()
+
+    def acquire(self) -> float:
+        """Wait until a request may be sent, and return the time it was sent to pass to 'release'."""
+        with self._condition:
+            while True:
+                wait = self._blocked_until - time.time()
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return time.time()
+                self._condition.wait(wait if wait > 0 else None)
+
+    def release(self, sent_at: float, error: Exception = None) -> None:
+        """Adjust the limit to the outcome of the request sent at 'sent_at', which failed with 'error' if given."""
+        now = time.time()
+        throttled = getattr(error, "code", None) in THROTTLED_CODES
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                retry_after = getattr(error, "retry_after", None)
+                if retry_after:
+                    self._blocked_until = max(self._blocked_until, now + retry_after)
+                self._decrease(sent_at, THROTTLED_DECREASE)
+                if self.monitor is not None:
+                    self.monitor.throttled_requests_counter.inc()
+            elif now - sent_at > self.latency_target:
+                self._decrease(sent_at, LATENCY_DECREASE)
+            elif error is None:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+        self._report()
+
+    def _decrease(self, sent_at: float, factor: float) -> None:
+        if sent_at <= self._decreased_at:  # Sent before the last decrease had any effect
+            return
+        self.limit = max(self.min_limit, self.limit * factor)
+        self._decreased_at = time.time()
+        logger.info("Upload concurrency limit lowered to {}".format(int(self.limit)))
+
+    def _report(self) -> None:
+        if self.monitor is not None:
+            self.monitor.concurrency_limit_gauge.set(int(self.limit))
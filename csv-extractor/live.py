@@ -0,0 +1,288 @@
+# coding: utf-8
+"""
+A module for extracting datapoints from csv files as soon as they are written to a folder.
+"""
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from batching import DatapointBatcher
+from csv_extractor import finish_file, flush_window, handle_parsed_file
+from csv_parser import is_csv_file_name, iter_csv_chunks, parse_csv_file_or_error
+from discovery import FileIndex
+from uploader import FileJob, Uploader
+
+logger = logging.getLogger(__name__)
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len of struct inotify_event
+RESCAN_SECONDS = 5.0  # Seconds between scans of a folder without unqueued files, in case events were lost
+
+
+class InotifyWatcher:
+    """Report csv files closed after writing, or moved into 'folder_path', using Linux inotify through libc."""
+
+    def __init__(self, folder_path):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(str(folder_path)), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, "inotify_add_watch failed on {!s}".format(folder_path))
+        self.folder_path = folder_path
+
+    def read_paths(self) -> list:
+        """Return the csv files reported since last read."""
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        paths = []
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+            if is_csv_file_name(name):
+                paths.append(self.folder_path.joinpath(name))
+        return paths
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+async def watch_csv_files(folder_path, queue: asyncio.Queue, queued: set, poll_interval: float = 1.0) -> None:
+    """Put new csv files in 'folder_path' that are not already in 'queued' to 'queue'.
+
+    Files already in the folder are queued newest first, while inotify events are followed. The folder is scanned every
+    'poll_interval' seconds while it holds files not queued yet, and every RESCAN_SECONDS otherwise, as no events are
+    seen for files written by other hosts to a network share. Where inotify is not available the folder is polled every
+    'poll_interval' seconds.
+    """
+
+    def enqueue(paths) -> int:
+        new_paths = [path for path in paths if path not in queued]
+        for path in new_paths:
+            queued.add(path)
+            queue.put_nowait(path)
+        return len(new_paths)
+
+    async def scan() -> int:
+        try:
+            paths = await loop.run_in_executor(None, partial(index.newest, skip=frozenset(queued)))
+        except OSError as exc:
+            logger.error("Failed to scan {!s}: {!s}".format(folder_path, exc))
+            return 0
+        return enqueue(paths)
+
+    loop = asyncio.get_running_loop()
+    index = FileIndex(folder_path)
+    try:
+        watcher = InotifyWatcher(folder_path)
+    except (AttributeError, OSError, TypeError) as exc:  # No inotify on this platform
+        logger.warning("Unable to watch {!s}, polling every {} seconds: {!s}".format(folder_path, poll_interval, exc))
+        while True:
+            await scan()
+            await asyncio.sleep(poll_interval)
+
+    try:
+        loop.add_reader(watcher.fd, lambda: enqueue(watcher.read_paths()))
+        while True:
+            # Files written before the watch started are only found by scanning, which returns the 20 newest files
+            # not queued yet. Keep scanning while that finds files, then only now and then in case events were lost.
+            await asyncio.sleep(poll_interval if await scan() else RESCAN_SECONDS)
+    finally:
+        loop.remove_reader(watcher.fd)
+        watcher.close()
+
+
+async def _parse_files(
+    paths: asyncio.Queue,
+    parsed: asyncio.Queue,
+    executor,
+    workers: int,
+    chunk_rows: int = None,
+    claim=None,
+    on_claim_failed=None,
+) -> None:
+    """Parse files from 'paths' with up to 'workers' files in flight in 'executor', putting results to 'parsed'.
+
+    With 'chunk_rows', files are passed on as lazy iterators of chunks instead. With 'claim', only files for which it
+    returns True are parsed, others are passed to 'on_claim_failed'.
+    """
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(workers)
+
+    async def parse(path):
+        try:
+            try:
+                result = await loop.run_in_executor(executor, parse_csv_file_or_error, path)
+            except Exception as exc:  # Worker died or result could not be transferred
+                result = None, exc
+            await parsed.put((path,) + result)
+        finally:  # Released only once the result is queued, so parsed files waiting in memory stay bounded
+            slots.release()
+
+    while True:
+        path = await paths.get()
+        try:
+            claimed = claim is None or claim(path)
+        except OSError as exc:  # Lease folder unavailable, tried again like a file claimed by another extractor
+            logger.error("Failed to claim {!s}: {!s}".format(path, exc))
+            claimed = False
+        if not claimed:
+            on_claim_failed(path)
+            continue
+        if chunk_rows:
+            await parsed.put((path, iter_csv_chunks(path, chunk_rows), None))
+            continue
+        await slots.acquire()
+        loop.create_task(parse(path))
+
+
+async def _get_or_raise(queue: asyncio.Queue, tasks: list):
+    """Return the next item of 'queue', or raise the exception of the first of 'tasks' to end before it arrives."""
+    get = asyncio.ensure_future(queue.get())
+    try:
+        done, _ = await asyncio.wait([get] + tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        if not get.done():
+            get.cancel()
+    if get in done:
+        return get.result()
+    for task in done:
+        task.result()
+    raise RuntimeError("Task ended while extracting: {!r}".format(done.pop()))
+
+
+async def run_live(
+    client,
+    monitor,
+    time_series_cache,
+    folder_path,
+    failed_path,
+    finished_path,
+    uploader: Uploader,
+    parse_workers: int = 1,
+    poll_interval: float = 1.0,
+    chunk_rows: int = None,
+    leases=None,
+    last_values=None,
+) -> None:
+    """Extract datapoints from csv files in 'folder_path' as they arrive, until cancelled.
+
+    Files are parsed concurrently in 'parse_workers' subprocesses (or a thread), then handled one at a time in a
+    dedicated thread. Datapoints are coalesced while more files are waiting, up to FILE_WINDOW files, and are submitted
+    to 'uploader' as soon as the queue runs empty. With 'chunk_rows', files are streamed in chunks in that thread. If
+    finding or parsing files fails unexpectedly, the extraction stops with that exception.
+    With 'leases', files claimed by other extractors are skipped, and tried again when their lease may have expired.
+    With 'last_values', datapoints already added are dropped, and forgotten again if their file fails.
+    """
+    loop = asyncio.get_running_loop()
+    paths = asyncio.Queue()
+    parsed = asyncio.Queue(maxsize=2 * parse_workers)
+    queued = set()
+    batcher = DatapointBatcher(uploader, last_values=last_values)
+    window = []
+
+    def on_done(job):
+        if last_values is not None and job.failed:
+            last_values.forget(job.watermarks)
+        finish_file(monitor, failed_path, finished_path, job)
+        if leases is not None:
+            leases.release(job.path)
+        loop.call_soon_threadsafe(queued.discard, job.path)
+
+    def handle(path, parsed_file, parse_error):
+        job = FileJob(path, on_done)
+        handle_parsed_file(
+            client, monitor, batcher, window, job, time_series_cache, failed_path, parsed_file, parse_error
+        )
+        if job not in window:  # Failed, the file is not finished by the uploader
+            if last_values is not None:
+                last_values.forget(job.watermarks)
+            if leases is not None:
+                leases.release(path)
+            loop.call_soon_threadsafe(queued.discard, path)
+
+    claim = on_claim_failed = None
+    if leases is not None:
+        claim = leases.claim
+
+        def on_claim_failed(path):
+            loop.call_later(leases.lease_seconds, queued.discard, path)
+
+    if parse_workers > 1:
+        parse_executor = ProcessPoolExecutor(max_workers=parse_workers)
+    else:
+        parse_executor = ThreadPoolExecutor(max_workers=1)
+    handle_executor = ThreadPoolExecutor(max_workers=1)  # The batcher is used from one thread only
+    tasks = [
+        loop.create_task(watch_csv_files(folder_path, paths, queued, poll_interval)),
+        loop.create_task(
+            _parse_files(paths, parsed, parse_executor, parse_workers, chunk_rows, claim, on_claim_failed)
+        ),
+    ]
+
+    try:
+        while True:
+            item = await _get_or_raise(parsed, tasks)
+            await loop.run_in_executor(handle_executor, partial(handle, *item))
+            monitor.available_csv_files_gauge.set(paths.qsize() + parsed.qsize())
+            if parsed.empty() and paths.empty():
+                await loop.run_in_executor(handle_executor, flush_window, batcher, window)
+            monitor.push()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await loop.run_in_executor(handle_executor, flush_window, batcher, window)
+        handle_executor.shutdown()
+        parse_executor.shutdown()
+
+
+def extract_data_points_live(
+    client,
+    monitor,
+    time_series_cache,
+    folder_path,
+    failed_path,
+    finished_path,
+    parse_workers: int = 1,
+    upload_workers: int = 10,
+    chunk_rows: int = None,
+    spool=None,
+    leases=None,
+    last_values=None,
+) -> None:
+    """Run the event driven live extraction until interrupted, keeping requests in 'spool' until uploaded."""
+    uploader = Uploader(client, upload_workers, monitor=monitor, spool=spool)
+    try:
+        asyncio.run(
+            run_live(
+                client,
+                monitor,
+                time_series_cache,
+                folder_path,
+                failed_path,
+                finished_path,
+                uploader,
+                parse_workers,
+                chunk_rows=chunk_rows,
+                leases=leases,
+                last_values=last_values,
+            )
+        )
+    finally:
+        uploader.stop()
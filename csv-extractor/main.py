@@ -15,8 +15,14 @@ import google.cloud.logging
 from cognite.client import CogniteClient
 from cognite.client.exceptions import CogniteAPIError
 
-from csv_extractor import extract_data_points, get_all_time_series
+from checkpoint import CheckpointStore
+from csv_extractor import extract_data_points
+from last_values import LastValueCache
+from leases import LeaseManager
+from live import extract_data_points_live
 from monitoring import configure_prometheus
+from spool import UploadSpool
+from time_series_cache import TimeSeriesCache
 
 logger = logging.getLogger(__name__)
 
@@ -38,6 +44,16 @@ def _parse_cli_args():
     parser.add_argument("--input", "-i", required=True, help="Folder path of the files to process")
     parser.add_argument("--log", "-d", required=False, default="log", help="Optional, log directory")
     parser.add_argument("--log-level", required=False, default="INFO", help="Optional, logging level")
+    parser.add_argument(
+        "--state", required=False, default="state", help="Optional, directory for caches kept between restarts"
+    )
+    parser.add_argument(
+        "--time-series-ttl",
+        required=False,
+        default=24 * 3600,
+        type=float,
+        help="Optional, seconds before a cached time series is looked up in CDF again",
+    )
     parser.add_argument(
         "--move-failed", required=False, action="store_true", help="Optional, move failed csv files to subfolder failed"
     )
@@ -49,6 +65,39 @@ def _parse_cli_args():
     )
     parser.add_argument("--from-time", required=False, type=int, help="Optional, only process if older")
     parser.add_argument("--until-time", required=False, type=int, help="Optional, only process if younger")
+    parser.add_argument(
+        "--parse-workers", required=False, default=1, type=int, help="Optional, number of processes parsing csv files"
+    )
+    parser.add_argument(
+        "--upload-workers", required=False, default=10, type=int, help="Optional, number of threads uploading to CDF"
+    )
+    parser.add_argument(
+        "--chunk-rows", required=False, type=int, help="Optional, stream csv files in chunks of this many rows"
+    )
+    parser.add_argument(
+        "--instance-id",
+        required=False,
+        help="Optional, share the input folder with other extractors, claiming files under this unique name",
+    )
+    parser.add_argument(
+        "--lease-seconds",
+        required=False,
+        default=300,
+        type=float,
+        help="Optional, seconds before a file claimed by an extractor that stopped may be claimed by another",
+    )
+    parser.add_argument(
+        "--skip-duplicates",
+        required=False,
+        action="store_true",
+        help="Optional, drop datapoints at times already uploaded, like rows repeated in overlapping files",
+    )
+    parser.add_argument(
+        "--deadband",
+        required=False,
+        type=float,
+        help="Optional, drop datapoints differing at most this much from the last value, implies --skip-duplicates",
+    )
 
     return parser.parse_args()
 
@@ -106,20 +155,59 @@ def main(args):
     project_name = client.config.project
     monitor = configure_prometheus(args.live, project_name)
 
+    state_path = Path(args.state)
+    state_path.mkdir(parents=True, exist_ok=True)
+    time_series_cache = TimeSeriesCache(client, state_path.joinpath("time-series.sqlite"), args.time_series_ttl)
+    spool = UploadSpool(state_path.joinpath("spool"))
+    leases = LeaseManager(input_path, args.instance_id, args.lease_seconds) if args.instance_id else None
+    last_values = None
+    if args.skip_duplicates or args.deadband is not None:
+        last_values = LastValueCache(deadband=args.deadband, monitor=monitor)
+
     try:
-        extract_data_points(
-            client,
-            monitor,
-            get_all_time_series(client),
-            args.live,
-            args.from_time,
-            args.until_time,
-            input_path,
-            failed_path,
-            finished_path,
-        )
+        if args.live:
+            extract_data_points_live(
+                client,
+                monitor,
+                time_series_cache,
+                input_path,
+                failed_path,
+                finished_path,
+                args.parse_workers,
+                args.upload_workers,
+                args.chunk_rows,
+                spool,
+                leases,
+                last_values,
+            )
+        else:
+            extract_data_points(
+                client,
+                monitor,
+                time_series_cache,
+                args.live,
+                args.from_time,
+                args.until_time,
+                input_path,
+                failed_path,
+                finished_path,
+                args.parse_workers,
+                args.upload_workers,
+                args.chunk_rows,
+                spool,
+                CheckpointStore(state_path.joinpath("checkpoint.sqlite")),
+                leases,
+                last_values,
+            )
+            if len(spool):
+                logger.error("{} requests were not uploaded, kept in the spool for the next run".format(len(spool)))
+                sys.exit(1)
     except KeyboardInterrupt:
         logger.warning("Extractor stopped")
+    finally:
+        if leases is not None:
+            leases.stop()
+        monitor.stop()
 
 
 if __name__ == "__main__":
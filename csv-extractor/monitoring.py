@@ -5,12 +5,65 @@ A module for sending monitoring statistics to Prometheus.
 import logging
 import os
 import socket
+import threading
 
 from cognite_prometheus.cognite_prometheus import CognitePrometheus
-from prometheus_client import Counter, Gauge, Info, PlatformCollector, ProcessCollector
+from prometheus_client import Counter, Gauge, Histogram, Info, PlatformCollector, ProcessCollector
 
 logger = logging.getLogger(__name__)
 
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+SIZE_BUCKETS = (10, 100, 1000, 5000, 10000, 25000, 50000, 75000, 100000, float("inf"))
+
+
+class MetricsPusher:
+    """Call 'push' from a background thread every 'interval' seconds, and soon after each 'request'.
+
+    Requests made while a push is in progress, or within 'min_interval' seconds after it, are coalesced into one push,
+    so callers never wait on the gateway.
+    """
+
+    def __init__(self, push, interval: float = 10.0, min_interval: float = 1.0):
+        self.push = push
+        self.interval = interval
+        self.min_interval = min_interval
+        self._requested = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def request(self) -> None:
+        """Ask for a push, without waiting for it."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="metrics-pusher", daemon=True)
+                self._thread.start()
+        self._requested.set()
+
+    def stop(self) -> None:
+        """Stop the background thread, and push the last updates."""
+        self._stopped.set()
+        self._requested.set()
+        with self._lock:
+            if self._thread is not None:
+                self._thread.join()
+        self._push()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._requested.wait(self.interval)
+            if self._stopped.is_set():
+                break
+            self._requested.clear()
+            self._push()
+            self._stopped.wait(self.min_interval)
+
+    def _push(self) -> None:
+        try:
+            self.push()
+        except Exception as exc:
+            logger.error("Failed to push prometheus data: {!s}".format(exc))
+
 
 def configure_prometheus(live: bool, project_name):
     """Configure prometheus object, or return dummy object if not configured."""
@@ -40,6 +93,7 @@ class Prometheus:
         self.namespace = "csv_live" if live else "csv_hist"
         self.label_values = {self.project_name}
         self.registry = CognitePrometheus.registry if registry is None else registry
+        self.pusher = MetricsPusher(self.prometheus.push_to_server)
 
         self.info = Info("host", "Host info", namespace=self.namespace, registry=CognitePrometheus.registry)
         self.info.info({"hostname": socket.gethostname(), "fqdn": socket.getfqdn()})
@@ -51,7 +105,7 @@ class Prometheus:
         )
 
         self.all_data_points_counter = self._create_metric(
-            Counter, "posted_data_points_total", "Number of datapoints posted since the extractor started running"
+            Counter, "posted_data_points_total", "Number of datapoints acknowledged since the extractor started running"
         )
 
         self.count_of_time_series_gauge = self._create_metric(
@@ -78,10 +132,85 @@ class Prometheus:
             "Number of csv files that has been successfully processed in this batch",
         )
 
-    def _create_metric(self, metric_class, name, description):
+        self.schema_cache_hits_counter = self._create_metric(
+            Counter, "schema_cache_hits_total", "Number of files with a header whose column mapping was cached"
+        )
+
+        self.schema_cache_misses_counter = self._create_metric(
+            Counter, "schema_cache_misses_total", "Number of files with a header whose column mapping was resolved"
+        )
+
+        self.discovery_histogram = self._create_metric(
+            Histogram, "discovery_seconds", "Time to find csv files to process", buckets=STAGE_BUCKETS
+        )
+
+        self.parse_histogram = self._create_metric(
+            Histogram, "parse_seconds", "Time to parse a csv file, or a chunk of it", buckets=STAGE_BUCKETS
+        )
+
+        self.conversion_histogram = self._create_metric(
+            Histogram, "conversion_seconds", "Time to convert parsed values to datapoints", buckets=STAGE_BUCKETS
+        )
+
+        self.time_series_creation_histogram = self._create_metric(
+            Histogram,
+            "time_series_creation_seconds",
+            "Time to look up and create missing time series of a csv header",
+            buckets=STAGE_BUCKETS,
+        )
+
+        self.upload_histogram = self._create_metric(
+            Histogram, "upload_request_seconds", "Latency of requests inserting datapoints", buckets=STAGE_BUCKETS
+        )
+
+        self.upload_size_histogram = self._create_metric(
+            Histogram, "upload_request_data_points", "Number of datapoints in each insert request", buckets=SIZE_BUCKETS
+        )
+
+        self.file_move_histogram = self._create_metric(
+            Histogram, "file_move_seconds", "Time to delete or move a processed csv file", buckets=STAGE_BUCKETS
+        )
+
+        self.rejected_cells_counter = self._create_metric(
+            Counter, "rejected_cells_total", "Number of non-empty csv cells skipped because they held no number"
+        )
+
+        self.duplicate_data_points_counter = self._create_metric(
+            Counter, "duplicate_data_points_total", "Number of datapoints dropped as already uploaded"
+        )
+
+        self.deadband_data_points_counter = self._create_metric(
+            Counter, "deadband_data_points_total", "Number of datapoints dropped as unchanged within the deadband"
+        )
+
+        self.upload_retries_counter = self._create_metric(
+            Counter, "upload_retries_total", "Number of insert requests sent again after a transient error"
+        )
+
+        self.throttled_requests_counter = self._create_metric(
+            Counter, "throttled_requests_total", "Number of insert requests answered with 429 or 503"
+        )
+
+        self.concurrency_limit_gauge = self._create_metric(
+            Gauge, "upload_concurrency_limit", "Number of insert requests allowed in flight at once"
+        )
+
+        self.upload_queue_gauge = self._create_metric(
+            Gauge, "upload_queue_requests", "Number of insert requests waiting for an upload thread"
+        )
+
+        self.in_flight_requests_gauge = self._create_metric(
+            Gauge, "in_flight_requests", "Number of insert requests currently being sent"
+        )
+
+        self.spooled_requests_gauge = self._create_metric(
+            Gauge, "spooled_requests", "Number of insert requests kept in the spool until acknowledged"
+        )
+
+    def _create_metric(self, metric_class, name, description, **kwargs):
         """Create a new metric of 'metric_class' with 'name' and 'description'."""
         return metric_class(
-            name, description, namespace=self.namespace, labelnames=self.labels, registry=self.registry
+            name, description, namespace=self.namespace, labelnames=self.labels, registry=self.registry, **kwargs
         ).labels(*self.label_values)
 
     def incr_failed_files_counter(self, amount: int = 1) -> None:
@@ -93,8 +222,13 @@ class Prometheus:
     def incr_total_data_points_counter(self, amount: int = 1) -> None:
         self.all_data_points_counter.inc(amount)
 
+    def incr_schema_cache_counter(self, hit: bool) -> None:
+        (self.schema_cache_hits_counter if hit else self.schema_cache_misses_counter).inc()
+
     def push(self):
-        try:
-            self.prometheus.push_to_server()
-        except Exception as exc:
-            logger.error("Failed to push prometheus data: {!s}".format(exc))
+        """Push the metrics to the gateway from a background thread, coalesced with other pushes in progress."""
+        self.pusher.request()
+
+    def stop(self):
+        """Push the last metrics and stop pushing."""
+        self.pusher.stop()
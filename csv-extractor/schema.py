@@ -0,0 +1,82 @@
+# coding: utf-8
+"""
+A module for caching how the columns of a csv header map to time series.
+"""
+import logging
+from collections import OrderedDict
+from typing import List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+NUMERIC = "numeric"
+STRING = "string"
+EMPTY = "empty"
+
+
+class ColumnSchema:
+    """The time series of the columns in a header.
+
+    'columns' lists (column index, externalId, name) for columns named 'externalId : name', other columns are ignored.
+    'checked_at' is when all the time series were last known to exist in CDF. 'kinds' maps the column index to
+    NUMERIC, STRING or EMPTY once classified.
+    """
+
+    def __init__(self, column_names: List[str]):
+        self.columns = []
+        for col, col_name in enumerate(column_names):
+            external_id, _, name = col_name.rpartition(":")
+            if external_id.strip():
+                self.columns.append((col, external_id.strip(), name.strip()))
+        self.checked_at = 0.0
+        self.kinds = {}
+        self.numeric_columns = []
+
+    def classify(self, valid: np.ndarray, rejected: np.ndarray) -> List[Tuple[int, str, str]]:
+        """Return the columns holding numbers, given the valid cells and rejected counts per column of a parsed file.
+
+        The columns are classified by the first file parsed with this header. After that only the string and empty
+        columns are checked, and become numeric once they hold a number, so numeric columns are never checked again.
+        """
+        if not self.kinds:
+            for col, external_id, _ in self.columns:
+                self.kinds[col] = NUMERIC if valid[col].any() else STRING if rejected[col] else EMPTY
+            strings = [external_id for col, external_id, _ in self.columns if self.kinds[col] == STRING]
+            if strings:
+                logger.info("Skipping columns holding no numbers: {}".format(", ".join(strings)))
+        else:
+            changed = [col for col, kind in self.kinds.items() if kind != NUMERIC and valid[col].any()]
+            if not changed:
+                return self.numeric_columns
+            for col in changed:
+                self.kinds[col] = NUMERIC
+
+        self.numeric_columns = [column for column in self.columns if self.kinds[column[0]] == NUMERIC]
+        return self.numeric_columns
+
+    @property
+    def names(self):
+        """Map of externalId -> name."""
+        return {external_id: name for _, external_id, name in self.columns}
+
+
+class SchemaCache:
+    """Keep the 'max_size' most recently used schemas by header fingerprint."""
+
+    def __init__(self, max_size: int = 1000):
+        self.max_size = max_size
+        self._schemas = OrderedDict()
+
+    def get(self, fingerprint: str, column_names: List[str]) -> Tuple[ColumnSchema, bool]:
+        """Return the schema of a header, and whether it was cached."""
+        schema = self._schemas.get(fingerprint)
+        if schema is not None:
+            self._schemas.move_to_end(fingerprint)
+            return schema, True
+
+        schema = ColumnSchema(column_names)
+        self._schemas[fingerprint] = schema
+        if len(self._schemas) > self.max_size:
+            self._schemas.popitem(last=False)
+        return schema, False
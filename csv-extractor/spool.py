@@ -0,0 +1,102 @@
+# coding: utf-8
+"""
+A module for spooling upload requests to disk until CDF has acknowledged them.
+"""
+import logging
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from payload import DataPoints
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"CSVS"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sHI")  # magic, version, number of time series
+SERIES_HEADER = struct.Struct("<HI")  # length of external ID, number of datapoints
+SUFFIX = ".spool"
+
+
+def encode_request(items: list) -> bytes:
+    """Encode a request of (externalId, DataPoints) as timestamps and values in little endian arrays."""
+    parts = [FILE_HEADER.pack(MAGIC, VERSION, len(items))]
+    for external_id, data_points in items:
+        external_id = external_id.encode("utf-8")
+        parts.append(SERIES_HEADER.pack(len(external_id), len(data_points)))
+        parts.append(external_id)
+        parts.append(data_points.timestamps.astype("<i8", copy=False).tobytes())
+        parts.append(data_points.values.astype("<f8", copy=False).tobytes())
+    return b"".join(parts)
+
+
+def decode_request(data: bytes) -> list:
+    """Decode a request encoded by 'encode_request'."""
+    magic, version, count = FILE_HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a spooled request of version {}".format(VERSION))
+
+    items = []
+    offset = FILE_HEADER.size
+    for _ in range(count):
+        id_length, length = SERIES_HEADER.unpack_from(data, offset)
+        offset += SERIES_HEADER.size
+        external_id = data[offset : offset + id_length].decode("utf-8")
+        offset += id_length
+        timestamps = np.frombuffer(data, "<i8", length, offset)
+        offset += 8 * length
+        values = np.frombuffer(data, "<f8", length, offset)
+        offset += 8 * length
+        items.append((external_id, DataPoints(timestamps, values)))
+    return items
+
+
+class UploadSpool:
+    """Write-ahead spool of upload requests in 'folder_path', one file per request until it is acknowledged.
+
+    Requests are written to a temporary file and renamed into place, so a crash never leaves a partial request behind.
+    Requests still in the folder at start, because the extractor stopped before they were uploaded, are replayed.
+    """
+
+    def __init__(self, folder_path):
+        self.folder_path = Path(folder_path)
+        self.folder_path.mkdir(parents=True, exist_ok=True)
+        for path in self.folder_path.glob("*.tmp"):
+            path.unlink()
+        self._lock = threading.Lock()
+        self._sequence = max((int(path.stem) for path in self.pending()), default=0)
+
+    def __len__(self) -> int:
+        return len(self.pending())
+
+    def pending(self) -> List[Path]:
+        """Return the requests not yet acknowledged, oldest first."""
+        return sorted(self.folder_path.glob("*" + SUFFIX))
+
+    def write(self, items: list) -> Path:
+        """Write the request durably to disk, and return the path to acknowledge it with."""
+        with self._lock:
+            self._sequence += 1
+            path = self.folder_path.joinpath("{:020d}{}".format(self._sequence, SUFFIX))
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(encode_request(items))
+            f.flush()
+            os.fsync(f.fileno())
+        tmp_path.replace(path)
+        return path
+
+    def read(self, path) -> list:
+        """Read the request spooled at 'path'."""
+        return decode_request(Path(path).read_bytes())
+
+    def ack(self, path) -> None:
+        """Remove the request at 'path', as it is uploaded or can never be."""
+        try:
+            Path(path).unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,94 @@
+# coding: utf-8
+"""
+Fixtures shared by the tests, most notably a local stand-in for CDF.
+"""
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import pytest
+from cognite.client import CogniteClient
+
+
+class _CDFHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        items = json.loads(body).get("items", [])
+        time.sleep(self.server.latency)
+
+        if self.path.endswith("/timeseries/data"):
+            with self.server.lock:
+                self.server.requests += 1
+                status, headers = self.server.responses.pop(0) if self.server.responses else (200, {})
+                if status == 200:
+                    self.server.posted.append(items)
+            if status != 200:
+                self._answer(status, {"error": {"code": status, "message": "Stub error"}}, headers)
+            else:
+                self._answer(200, {})
+        elif self.path.endswith("/timeseries/byids"):
+            self._answer(200, {"items": []})
+        elif self.path.endswith("/timeseries"):
+            self._answer(200, {"items": [dict(item, id=i) for i, item in enumerate(items)]})
+        else:
+            self._answer(404, {"error": {"code": 404, "message": "Not found"}})
+
+    def _answer(self, status, content, headers=None):
+        data = json.dumps(content).encode("utf-8")
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubCDF(ThreadingMixIn, HTTPServer):
+    """Local stand-in for the CDF endpoints used by the extractor, answering after 'latency' seconds.
+
+    The items of every accepted datapoints request are kept in 'posted', and 'requests' counts the datapoints requests
+    received. Datapoints requests are answered with the (status, headers) in 'responses' first, then with 200.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _CDFHandler)
+        self.latency = 0.0
+        self.posted = []
+        self.requests = 0
+        self.responses = []
+        self.lock = threading.Lock()
+
+
+@pytest.fixture
+def cdf():
+    server = StubCDF()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def stub_client(cdf):
+    """A CogniteClient talking to the local stand-in for CDF, with its requests in 'posted'."""
+    client = CogniteClient(
+        api_key="test",
+        project="test",
+        client_name="test",
+        base_url="http://127.0.0.1:{}".format(cdf.server_port),
+        disable_pypi_version_check=True,
+    )
+    client.posted = cdf.posted
+    return client
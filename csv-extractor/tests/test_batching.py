@@ -0,0 +1,86 @@
+# coding: utf-8
+"""
+A module for testing the packing of datapoints into requests.
+"""
+from unittest import mock
+
+import numpy as np
+
+from batching import DatapointBatcher
+from payload import DataPoints
+from uploader import FileJob
+
+
+def _data_points(count, start=0):
+    return DataPoints(np.arange(start, start + count, dtype=np.int64) * 1000, np.ones(count))
+
+
+class TestDatapointBatcher:
+    def test_requests_are_cut_on_data_points_and_long_series_split(self):
+        uploader = mock.MagicMock()
+        batcher = DatapointBatcher(uploader, max_time_series=10, max_data_points=5)
+        job = FileJob("a.csv")
+
+        batcher.add(job, "a", _data_points(3))
+        batcher.add(job, "b", _data_points(8))
+        batcher.flush()
+
+        requests = [c[0][1] for c in uploader.submit.call_args_list]
+        assert [[(external_id, len(data_points)) for external_id, data_points in r] for r in requests] == [
+            [("a", 3), ("b", 2)],
+            [("b", 5)],
+            [("b", 1)],
+        ]
+        assert job.data_points_count == 11
+
+    def test_requests_are_cut_on_time_series(self):
+        uploader = mock.MagicMock()
+        batcher = DatapointBatcher(uploader, max_time_series=2)
+        job = FileJob("a.csv")
+
+        for external_id in "abc":
+            batcher.add(job, external_id, _data_points(1))
+        batcher.flush()
+
+        assert [len(c[0][1]) for c in uploader.submit.call_args_list] == [2, 1]
+
+    def test_same_external_id_is_coalesced_across_files(self):
+        uploader = mock.MagicMock()
+        batcher = DatapointBatcher(uploader)
+        first, second = FileJob("a.csv"), FileJob("b.csv")
+
+        batcher.add(first, "a", _data_points(1))
+        batcher.add(second, "a", _data_points(2, start=1))
+        batcher.flush()
+
+        uploader.submit.assert_called_once_with(
+            [first, second], [("a", _data_points(3))], {first: [("a", 0, 0)], second: [("a", 1000, 2000)]}
+        )
+
+    def test_requests_are_attributed_to_files_with_datapoints_in_them(self):
+        uploader = mock.MagicMock()
+        batcher = DatapointBatcher(uploader, max_time_series=10, max_data_points=4)
+        first, second = FileJob("a.csv"), FileJob("b.csv")
+
+        batcher.add(first, "a", _data_points(3))
+        batcher.add(second, "b", _data_points(3))
+        batcher.add(second, "c", _data_points(2))
+        batcher.flush()
+
+        assert [c[0][0] for c in uploader.submit.call_args_list] == [[first, second], [second]]
+
+    def test_discarded_file_is_not_submitted(self):
+        uploader = mock.MagicMock()
+        batcher = DatapointBatcher(uploader, max_time_series=10, max_data_points=8)
+        first, second = FileJob("a.csv"), FileJob("b.csv")
+
+        batcher.add(first, "a", _data_points(2))
+        batcher.add(second, "a", _data_points(2, start=2))
+        batcher.add(second, "b", _data_points(2))
+        batcher.discard(second)
+        batcher.add(first, "c", _data_points(3))
+        batcher.flush()
+
+        uploader.submit.assert_called_once_with(
+            [first], [("a", _data_points(2)), ("c", _data_points(3))], {first: [("a", 0, 1000), ("c", 0, 2000)]}
+        )
@@ -0,0 +1,97 @@
+# coding: utf-8
+"""
+A module for testing the checkpoint of historical backfills.
+"""
+
+import shutil
+from itertools import chain
+from pathlib import Path
+from unittest import mock
+
+from checkpoint import FINISHED, STARTED, CheckpointStore
+from csv_extractor import process_files
+from time_series_cache import TimeSeriesCache
+from uploader import FileJob
+
+
+class TestCheckpointStore:
+    folder_path = Path(__file__).parent / "test_files"  # folder with input data
+
+    def _copy(self, tmp_path, file_name):
+        path = tmp_path / file_name
+        shutil.copy2(str(self.folder_path / file_name), str(path))
+        return path
+
+    def test_progress_is_kept_until_file_finished(self, tmp_path):
+        checkpoint = CheckpointStore(tmp_path / "checkpoint.sqlite")
+        job = FileJob(self._copy(tmp_path, "TEBIS_FK_1550092560.csv"))
+        checkpoint.start(job)
+        checkpoint.uploaded(job, [("a", 1000, 2000), ("b", 1000, 1000)])
+        checkpoint.uploaded(job, [("a", 3000, 4000)])
+
+        checkpoint = CheckpointStore(tmp_path / "checkpoint.sqlite")
+        assert checkpoint.file_status(job.path) == STARTED
+        assert checkpoint.progress(job.path) == {"a": [(1000, 2000), (3000, 4000)], "b": [(1000, 1000)]}
+
+        job = FileJob(job.path)
+        checkpoint.start(job, resumed=True)
+        assert checkpoint.progress(job.path) == {"a": [(1000, 2000), (3000, 4000)], "b": [(1000, 1000)]}
+        checkpoint.done(job)
+        assert checkpoint.file_status(job.path) == FINISHED
+        assert checkpoint.progress(job.path) == {}
+
+    def test_changed_and_failed_files_are_not_known(self, tmp_path):
+        checkpoint = CheckpointStore()
+        changed = FileJob(self._copy(tmp_path, "TEBIS_FK_1550092560.csv"))
+        failed = FileJob(self._copy(tmp_path, "TEBIS_FK_1550092620.csv"))
+        checkpoint.start(changed)
+        checkpoint.start(failed)
+        failed.failed = True
+        checkpoint.done(failed)
+        checkpoint.done(changed)
+
+        with open(changed.path, "a") as f:
+            f.write("1550092561;1,0\n")
+        assert checkpoint.file_status(changed.path) is None
+        assert checkpoint.file_status(failed.path) is None
+
+    def _process(self, client, checkpoint, paths):
+        del client.posted[:]
+        process_files(client, mock.MagicMock(), paths, TimeSeriesCache(client), None, None, checkpoint=checkpoint)
+        posted = list(chain.from_iterable(client.posted))
+        return [dp["timestamp"] for ts in posted if ts["externalId"] == "33" for dp in ts["datapoints"]]
+
+    def test_process_files_resumes_after_uploaded_datapoints(self, tmp_path, stub_client):
+        checkpoint = CheckpointStore(tmp_path / "checkpoint.sqlite")
+        resumed = FileJob(self._copy(tmp_path, "TEBIS_FK_1550092560.csv"))
+        checkpoint.start(resumed)
+        checkpoint.uploaded(resumed, [("33", 1550092501000, 1550092530000)])
+        checkpoint = CheckpointStore(tmp_path / "checkpoint.sqlite")  # Restarted before the rest was uploaded
+
+        timestamps = self._process(stub_client, checkpoint, [resumed.path])
+
+        assert timestamps == [ts * 1000 for ts in range(1550092531, 1550092561)]
+        assert not resumed.path.exists()
+        assert checkpoint.progress(resumed.path) == {}
+
+    def test_resumed_file_is_not_filtered_by_newer_files(self, tmp_path, stub_client):
+        lines = (self.folder_path / "TEBIS_FK_1550092560.csv").read_text(encoding="latin-1").splitlines(True)
+        newer = tmp_path / "TEBIS_FK_1550092680.csv"
+        newer.write_text("".join(lines[:2] + [str(int(line[:10]) + 120) + line[10:] for line in lines[2:]]))
+        checkpoint = CheckpointStore(tmp_path / "checkpoint.sqlite")
+        assert len(self._process(stub_client, checkpoint, [newer])) == 60
+        older = FileJob(self._copy(tmp_path, "TEBIS_FK_1550092560.csv"))  # An older window exported again
+        checkpoint.start(older)
+        checkpoint = CheckpointStore(tmp_path / "checkpoint.sqlite")  # Restarted before anything was uploaded
+
+        assert len(self._process(stub_client, checkpoint, [older.path])) == 60
+
+    def test_acknowledged_requests_are_recorded(self, tmp_path, stub_client):
+        checkpoint = CheckpointStore(tmp_path / "checkpoint.sqlite")
+        path = self._copy(tmp_path, "TEBIS_FK_1550092560.csv")
+        progress = []
+        checkpoint.done = lambda job: progress.append(checkpoint.progress(job.path))  # Stop before it is cleared
+
+        self._process(stub_client, checkpoint, [path])
+
+        assert progress == [{"33": [(1550092501000, 1550092560000)]}]
@@ -0,0 +1,129 @@
+# coding: utf-8
+"""
+A module for testing the columnar csv parser.
+"""
+import gzip
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from benchmark import column_data_points, create_data_points, get_parsed_file, write_tebis_file
+from csv_parser import iter_csv_chunks, parse_csv_file
+
+
+class TestCsvParser:
+    folder_path = Path(__file__).parent / "test_files"  # folder with input data
+
+    def test_parse_matches_legacy_parser(self):
+        for file_name in ["TEBIS_FK_1550092560.csv", "TEBIS_FK_1550092620.csv", "TEBIS_FK_1550092680.csv"]:
+            file_path = self.folder_path / file_name
+            legacy = get_parsed_file(file_path)
+            timestamps = legacy.pop("")[1:]
+            parsed_file = parse_csv_file(file_path)
+
+            assert parsed_file.column_names == list(legacy.keys())
+            for col, values in enumerate(legacy.values()):
+                expected = create_data_points(values[1:], timestamps)
+                result = column_data_points(
+                    parsed_file.timestamps * 1000, parsed_file.values[col], parsed_file.valid[col]
+                )
+                assert result == expected
+
+    def test_parse_masks_empty_and_non_float_cells(self, tmp_path):
+        file_path = tmp_path / "mixed.csv"
+        file_path.write_text(";1 : A;2 : B\nZeitstempel;bar;bar\n10;1,5;\n11;abc;2.5\n", encoding="latin-1")
+
+        parsed_file = parse_csv_file(file_path)
+
+        assert parsed_file.timestamps.tolist() == [10, 11]
+        assert parsed_file.valid.tolist() == [[True, False], [False, True]]
+        assert parsed_file.values[0, 0] == 1.5
+        assert parsed_file.values[1, 1] == 2.5
+        assert parsed_file.rejected.tolist() == [1, 0]
+
+    def test_parse_status_column_by_distinct_texts(self, tmp_path):
+        file_path = tmp_path / "status.csv"
+        rows = "".join("{};{};{}\n".format(ts, "Aus" if ts % 3 else "1,5", ts) for ts in range(100))
+        file_path.write_text(";1 : A;2 : B\nZeitstempel;;bar\n" + rows, encoding="latin-1")
+
+        parsed_file = parse_csv_file(file_path)
+
+        assert parsed_file.valid[0].tolist() == [ts % 3 == 0 for ts in range(100)]
+        assert np.all(parsed_file.values[0][parsed_file.valid[0]] == 1.5)
+        assert parsed_file.rejected.tolist() == [66, 0]
+
+    def test_parse_matches_frame_of_columns(self, tmp_path):
+        for decimal_comma in [True, False]:
+            file_path = tmp_path / "TEBIS_FK_1550092560.csv"
+            write_tebis_file(file_path, 200, 20, empty_ratio=0.3, non_float_ratio=0.05, decimal_comma=decimal_comma)
+            with file_path.open("a", encoding="latin-1") as f:
+                f.write("\r\n1550092999" + ";" * 200)  # Blank line, and a last row of empty cells
+
+            parsed_file = parse_csv_file(file_path)
+            (chunk,) = iter_csv_chunks(file_path, 100)  # Read by pd.read_csv into a frame of columns
+
+            assert parsed_file.values.shape == (200, 21)
+            np.testing.assert_array_equal(parsed_file.timestamps, chunk.timestamps)
+            np.testing.assert_array_equal(parsed_file.values, chunk.values)
+            np.testing.assert_array_equal(parsed_file.valid, chunk.valid)
+            np.testing.assert_array_equal(parsed_file.rejected, chunk.rejected)
+            assert parsed_file.rejected.any()
+
+    def test_chunks_match_whole_file(self):
+        file_path = self.folder_path / "TEBIS_FK_1550092620.csv"
+        parsed_file = parse_csv_file(file_path)
+
+        chunks = list(iter_csv_chunks(file_path, 7))
+
+        assert [len(chunk.timestamps) for chunk in chunks] == [7] * 8 + [4]
+        assert all(chunk.column_names == parsed_file.column_names for chunk in chunks)
+        assert all(chunk.fingerprint == parsed_file.fingerprint for chunk in chunks)
+        assert np.array_equal(np.concatenate([chunk.timestamps for chunk in chunks]), parsed_file.timestamps)
+        assert np.array_equal(np.concatenate([chunk.values for chunk in chunks], axis=1), parsed_file.values)
+
+    def test_parse_compressed_files(self, tmp_path):
+        file_path = self.folder_path / "TEBIS_FK_1550092620.csv"
+        parsed_file = parse_csv_file(file_path)
+        gz_path = tmp_path / "TEBIS_FK_1550092620.csv.gz"
+        gz_path.write_bytes(gzip.compress(file_path.read_bytes()))
+        zip_path = tmp_path / "TEBIS_FK_1550092620.zip"
+        with zipfile.ZipFile(str(zip_path), "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.write(str(file_path), file_path.name)
+
+        for path in [gz_path, zip_path]:
+            np.testing.assert_array_equal(parse_csv_file(path).values, parsed_file.values)
+            chunks = list(iter_csv_chunks(path, 7))
+            assert np.array_equal(np.concatenate([chunk.timestamps for chunk in chunks]), parsed_file.timestamps)
+
+    def test_parse_zstd_file(self, tmp_path):
+        zstandard = pytest.importorskip("zstandard")
+        file_path = self.folder_path / "TEBIS_FK_1550092620.csv"
+        zst_path = tmp_path / "TEBIS_FK_1550092620.csv.zst"
+        zst_path.write_bytes(zstandard.ZstdCompressor().compress(file_path.read_bytes()))
+
+        np.testing.assert_array_equal(parse_csv_file(zst_path).values, parse_csv_file(file_path).values)
+
+    def test_parse_zip_of_several_files(self, tmp_path):
+        zip_path = tmp_path / "TEBIS_FK_1550092620.zip"
+        with zipfile.ZipFile(str(zip_path), "w") as archive:
+            for name in ["TEBIS_FK_1550092560.csv", "TEBIS_FK_1550092620.csv", "TEBIS_FK_1550092680.csv"]:
+                archive.write(str(self.folder_path / name), name)
+            archive.writestr("readme.txt", "not a csv file")
+
+        parsed_files = parse_csv_file(zip_path)
+
+        assert [len(parsed_file.timestamps) for parsed_file in parsed_files] == [
+            len(parse_csv_file(self.folder_path / name).timestamps)
+            for name in ["TEBIS_FK_1550092560.csv", "TEBIS_FK_1550092620.csv", "TEBIS_FK_1550092680.csv"]
+        ]
+
+    def test_parse_generated_file(self, tmp_path):
+        file_path = tmp_path / "TEBIS_FK_1550092560.csv"
+        write_tebis_file(file_path, columns=50, rows=30, empty_ratio=0.2, non_float_ratio=0.1)
+
+        parsed_file = parse_csv_file(file_path)
+
+        assert parsed_file.values.shape == (50, 30)
+        assert 0.6 < parsed_file.valid.mean() < 0.8
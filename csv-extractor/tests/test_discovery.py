@@ -0,0 +1,85 @@
+# coding: utf-8
+"""
+A module for testing the file index.
+"""
+import os
+import time
+from unittest import mock
+
+from discovery import FileIndex, filename_timestamp
+
+
+def _touch(path, modified_timestamp):
+    path.write_text(";1 : A\n")
+    os.utime(str(path), (modified_timestamp, modified_timestamp))
+
+
+class TestFileIndex:
+    def test_filename_timestamp(self):
+        assert filename_timestamp("TEBIS_FK_1550092560.csv") == 1550092560
+        assert filename_timestamp("TEBIS_1550092560.csv") is None
+        assert filename_timestamp("TEBIS_FK_last.csv") is None
+        assert filename_timestamp("TEBIS_FK_1550092560.csv.gz") == 1550092560
+        assert filename_timestamp("TEBIS_FK_1550092560.zip") == 1550092560
+
+    def test_historical_sorted_and_filtered_on_timestamp_postfix(self, tmp_path):
+        old = time.time() - 100
+        for name in ["TEBIS_FK_300.csv", "TEBIS_FK_100.csv", "other.csv", "TEBIS_FK_200.csv", "notes.txt"]:
+            _touch(tmp_path / name, old)
+        index = FileIndex(tmp_path)
+
+        assert [p.name for p in index.historical()] == [
+            "other.csv",
+            "TEBIS_FK_100.csv",
+            "TEBIS_FK_200.csv",
+            "TEBIS_FK_300.csv",
+        ]
+        assert [p.name for p in index.historical(100, 300)] == ["TEBIS_FK_200.csv"]
+
+    def test_compressed_files_are_found(self, tmp_path):
+        old = time.time() - 100
+        for name in ["TEBIS_FK_300.zip", "TEBIS_FK_100.csv.gz", "TEBIS_FK_200.csv", "notes.txt.gz"]:
+            _touch(tmp_path / name, old)
+
+        assert [p.name for p in FileIndex(tmp_path).historical()] == [
+            "TEBIS_FK_100.csv.gz",
+            "TEBIS_FK_200.csv",
+            "TEBIS_FK_300.zip",
+        ]
+
+    def test_newest_leaves_out_files_being_written(self, tmp_path):
+        now = time.time()
+        for i in range(30):
+            _touch(tmp_path / "TEBIS_FK_{}.csv".format(i), now - 100 + i)
+        _touch(tmp_path / "TEBIS_FK_new.csv", now)
+        index = FileIndex(tmp_path)
+
+        newest = index.newest()
+
+        assert [p.name for p in newest] == ["TEBIS_FK_{}.csv".format(i) for i in range(29, 9, -1)]
+        for path in newest:
+            path.unlink()
+        assert [p.name for p in index.newest(3)] == ["TEBIS_FK_9.csv", "TEBIS_FK_8.csv", "TEBIS_FK_7.csv"]
+        assert [p.name for p in index.newest(2, skip={tmp_path / "TEBIS_FK_9.csv"})] == [
+            "TEBIS_FK_8.csv",
+            "TEBIS_FK_7.csv",
+        ]
+
+    def test_only_new_files_are_stated_and_unchanged_folder_not_listed(self, tmp_path):
+        old = time.time() - 100
+        for i in range(10):
+            _touch(tmp_path / "TEBIS_FK_{}.csv".format(i), old)
+        os.utime(str(tmp_path), (old, old))
+        index = FileIndex(tmp_path)
+        index.refresh()
+
+        with mock.patch("os.scandir", side_effect=os.scandir) as scandir:
+            index.refresh()
+            scandir.assert_not_called()
+
+            _touch(tmp_path / "TEBIS_FK_10.csv", old)
+            with mock.patch("os.stat", side_effect=os.stat) as stat:
+                assert len(index.historical()) == 11
+            scandir.assert_called_once()
+            stated = [c[0][0] for c in stat.call_args_list]
+            assert stated == [str(tmp_path), str(tmp_path / "TEBIS_FK_10.csv")]
@@ -3,11 +3,17 @@
 A module for testing the extractor.
 """
 import os
+import shutil
+import zipfile
+from itertools import chain
 from pathlib import Path
+from unittest import mock
 
 import pandas
 
-from csv_extractor import create_data_points, find_historical_files_in_path
+from benchmark import create_data_points
+from csv_extractor import extract_data_points, find_historical_files_in_path, process_files
+from time_series_cache import TimeSeriesCache
 
 
 class TestExtractor:
@@ -25,3 +31,81 @@ class TestExtractor:
 
         result = create_data_points(values, timestamps)
         assert len(result), 60
+
+    def test_stage_histograms_are_observed_once_per_file(self, tmp_path, stub_client):
+        for file_name in ["TEBIS_FK_1550092560.csv", "TEBIS_FK_1550092680.csv"]:
+            folder = tmp_path / file_name
+            folder.mkdir()
+            shutil.copy(str(self.folder_path / file_name), str(folder / file_name))
+            monitor = mock.MagicMock()
+
+            time_series_cache = TimeSeriesCache(stub_client)
+            extract_data_points(stub_client, monitor, time_series_cache, False, None, None, folder, None, None)
+
+            assert not (folder / file_name).exists()
+            for histogram in [monitor.discovery_histogram, monitor.time_series_creation_histogram]:
+                assert histogram.time.call_count == 1
+            for histogram in [monitor.parse_histogram, monitor.conversion_histogram]:
+                assert histogram.observe.call_count == 1
+            assert monitor.file_move_histogram.time.call_count == 1
+
+    def test_process_files_with_parse_workers(self, tmp_path, stub_client):
+        paths = []
+        for file_name in ["TEBIS_FK_1550092560.csv", "TEBIS_FK_1550092620.csv", "TEBIS_FK_1550092680.csv"]:
+            paths.append(tmp_path / file_name)
+            shutil.copy(str(self.folder_path / file_name), str(paths[-1]))
+        finished_path = tmp_path / "finished"
+        finished_path.mkdir()
+        client = stub_client
+        monitor = mock.MagicMock()
+
+        process_files(client, monitor, paths, TimeSeriesCache(client), None, finished_path, parse_workers=2)
+
+        posted = list(chain.from_iterable(client.posted))
+        assert len(posted) == 13
+        assert {"33", "69", "136"} <= {ts["externalId"] for ts in posted}
+        assert sorted(p.name for p in finished_path.iterdir()) == sorted(p.name for p in paths)
+        counted = sum(c[0][0] for c in monitor.incr_total_data_points_counter.call_args_list)
+        assert counted == sum(len(ts["datapoints"]) for ts in posted)
+
+    def test_failed_chunk_drops_datapoints_of_earlier_chunks(self, tmp_path, stub_client):
+        lines = (self.folder_path / "TEBIS_FK_1550092560.csv").read_text().splitlines(True)
+        lines[12] = "not a timestamp;0,5\n"  # The 11th row, in the second chunk
+        path = tmp_path / "TEBIS_FK_1550092560.csv"
+        path.write_text("".join(lines))
+        failed_path = tmp_path / "failed"
+        failed_path.mkdir()
+        client = stub_client
+
+        process_files(client, mock.MagicMock(), [path], TimeSeriesCache(client), failed_path, None, chunk_rows=10)
+
+        assert client.posted == []
+        assert [p.name for p in failed_path.iterdir()] == [path.name]
+
+    def test_corrupt_gzip_file_is_moved_to_failed(self, tmp_path, stub_client):
+        path = tmp_path / "TEBIS_FK_1550092560.csv.gz"
+        path.write_bytes((self.folder_path / "TEBIS_FK_1550092560.csv").read_bytes())  # Not compressed
+        failed_path = tmp_path / "failed"
+        failed_path.mkdir()
+        monitor = mock.MagicMock()
+
+        process_files(stub_client, monitor, [path], TimeSeriesCache(stub_client), failed_path, None)
+
+        assert [p.name for p in failed_path.iterdir()] == [path.name]
+        monitor.incr_failed_files_counter.assert_called_once_with()
+
+    def test_process_zip_archive_in_workers(self, tmp_path, stub_client):
+        zip_path = tmp_path / "TEBIS_FK_1550092680.zip"
+        with zipfile.ZipFile(str(zip_path), "w", zipfile.ZIP_DEFLATED) as archive:
+            for file_name in ["TEBIS_FK_1550092560.csv", "TEBIS_FK_1550092620.csv", "TEBIS_FK_1550092680.csv"]:
+                archive.write(str(self.folder_path / file_name), file_name)
+        client = stub_client
+        monitor = mock.MagicMock()
+
+        process_files(client, monitor, [zip_path], TimeSeriesCache(client), None, None, parse_workers=2)
+
+        posted = list(chain.from_iterable(client.posted))
+        assert {"33", "69", "136"} <= {ts["externalId"] for ts in posted}
+        counted = sum(c[0][0] for c in monitor.incr_total_data_points_counter.call_args_list)
+        assert counted == sum(len(ts["datapoints"]) for ts in posted) > 0
+        assert not zip_path.exists()
@@ -0,0 +1,73 @@
+# coding: utf-8
+"""
+A module for testing the suppression of duplicate and unchanged datapoints.
+"""
+from unittest import mock
+
+import numpy as np
+
+from batching import DatapointBatcher
+from last_values import LastValueCache
+from payload import DataPoints
+from uploader import FileJob
+
+
+def _data_points(timestamps, values):
+    return DataPoints(np.array(timestamps, dtype=np.int64), np.array(values, dtype=np.float64))
+
+
+class TestLastValueCache:
+    def test_overlapping_datapoints_are_dropped(self):
+        monitor = mock.MagicMock()
+        cache = LastValueCache(monitor=monitor)
+
+        assert cache.filter("a", _data_points([1, 2, 3], [1, 2, 3])) == _data_points([1, 2, 3], [1, 2, 3])
+        assert cache.filter("a", _data_points([3, 4, 5], [3, 4, 5])) == _data_points([4, 5], [4, 5])
+        assert cache.filter("a", _data_points([1, 2, 3, 4, 5], [1, 2, 3, 4, 5])) == _data_points([], [])
+        assert cache.filter("b", _data_points([1, 2], [1, 2])) == _data_points([1, 2], [1, 2])
+        assert monitor.duplicate_data_points_counter.inc.call_args_list == [mock.call(1), mock.call(5)]
+
+    def test_older_datapoints_are_kept(self):
+        cache = LastValueCache()
+        cache.filter("a", _data_points([10, 11], [1, 2]))
+
+        assert cache.filter("a", _data_points([5, 6], [1, 2])) == _data_points([5, 6], [1, 2])
+        assert cache.filter("a", _data_points([1, 2, 3], [1, 2, 3])) == _data_points([1, 2, 3], [1, 2, 3])
+        assert cache.filter("a", _data_points([11, 12], [2, 3])) == _data_points([12], [3])
+
+    def test_unchanged_values_are_dropped(self):
+        monitor = mock.MagicMock()
+        cache = LastValueCache(deadband=0, monitor=monitor)
+
+        assert cache.filter("a", _data_points([1, 2, 3, 4], [1, 1, 2, 2])) == _data_points([1, 3], [1, 2])
+        assert cache.filter("a", _data_points([5, 6], [2, 1])) == _data_points([6], [1])
+        assert monitor.deadband_data_points_counter.inc.call_args_list == [mock.call(2), mock.call(1)]
+
+    def test_values_within_deadband_are_dropped(self):
+        cache = LastValueCache(deadband=0.5)
+
+        result = cache.filter("a", _data_points([1, 2, 3, 4, 5], [1.0, 1.3, 1.6, 2.0, 2.2]))
+
+        assert result == _data_points([1, 3, 5], [1.0, 1.6, 2.2])
+
+    def test_least_recently_used_is_evicted_and_failed_forgotten(self):
+        cache = LastValueCache(max_size=2)
+        for external_id in ["a", "b", "c"]:
+            cache.filter(external_id, _data_points([1], [1]))
+
+        assert len(cache) == 2
+        assert len(cache.filter("a", _data_points([1], [1]))) == 1
+        cache.forget(["a"])
+        assert len(cache.filter("a", _data_points([1], [1]))) == 1
+
+    def test_batcher_drops_datapoints_of_overlapping_files(self):
+        uploader = mock.MagicMock()
+        batcher = DatapointBatcher(uploader, last_values=LastValueCache())
+        first_job, second_job = FileJob("a.csv"), FileJob("b.csv")
+
+        batcher.add(first_job, "a", _data_points([1, 2, 3], [1, 2, 3]))
+        batcher.add(second_job, "a", _data_points([3, 4], [3, 4]))
+        batcher.flush()
+
+        assert uploader.submit.call_args[0][1] == [("a", _data_points([1, 2, 3, 4], [1, 2, 3, 4]))]
+        assert second_job.data_points_count == 1
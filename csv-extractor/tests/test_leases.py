@@ -0,0 +1,99 @@
+# coding: utf-8
+"""
+A module for testing the leases of files shared between extractors.
+"""
+import os
+import shutil
+import time
+from pathlib import Path
+from unittest import mock
+
+from csv_extractor import process_files
+from leases import LeaseManager
+from time_series_cache import TimeSeriesCache
+
+
+class TestLeaseManager:
+    folder_path = Path(__file__).parent / "test_files"  # folder with input data
+
+    def _copy(self, tmp_path, file_name):
+        path = tmp_path / file_name
+        shutil.copy(str(self.folder_path / file_name), str(path))
+        return path
+
+    def test_only_one_extractor_claims_a_file(self, tmp_path):
+        path = self._copy(tmp_path, "TEBIS_FK_1550092560.csv")
+        first = LeaseManager(tmp_path, "first")
+        second = LeaseManager(tmp_path, "second")
+
+        assert first.claim(path)
+        assert first.claim(path)
+        assert not second.claim(path)
+
+        first.release(path)
+        assert second.claim(path)
+        assert (tmp_path / ".leases" / "TEBIS_FK_1550092560.csv.lease").read_text() == "second"
+
+    def test_expired_lease_is_taken_over(self, tmp_path):
+        path = self._copy(tmp_path, "TEBIS_FK_1550092560.csv")
+        assert LeaseManager(tmp_path, "dead", lease_seconds=60).claim(path)
+        other = LeaseManager(tmp_path, "other", lease_seconds=60)
+        assert not other.claim(path)
+
+        expired = time.time() - 120
+        os.utime(str(tmp_path / ".leases" / "TEBIS_FK_1550092560.csv.lease"), (expired, expired))
+
+        assert other.claim(path)
+        assert sorted(p.name for p in (tmp_path / ".leases").iterdir()) == ["TEBIS_FK_1550092560.csv.lease"]
+
+    def test_lease_renewed_during_take_over_does_not_replace_new_lease(self, tmp_path, monkeypatch):
+        path = self._copy(tmp_path, "TEBIS_FK_1550092560.csv")
+        lease_path = tmp_path / ".leases" / "TEBIS_FK_1550092560.csv.lease"
+        assert LeaseManager(tmp_path, "owner", lease_seconds=60).claim(path)
+        expired = time.time() - 120
+        os.utime(str(lease_path), (expired, expired))
+        replace = Path.replace
+
+        def renew_and_claim_while_moved(self, target):
+            replace(self, target)
+            if target.suffix == ".stale":
+                os.utime(str(target))  # Renewed by the owner just before it was moved
+                lease_path.write_text("third")  # Claimed by a third extractor meanwhile
+
+        monkeypatch.setattr(Path, "replace", renew_and_claim_while_moved)
+        assert not LeaseManager(tmp_path, "other", lease_seconds=60).claim(path)
+
+        assert lease_path.read_text() == "third"
+        assert sorted(p.name for p in (tmp_path / ".leases").iterdir()) == ["TEBIS_FK_1550092560.csv.lease"]
+
+    def test_leases_are_renewed_in_background(self, tmp_path):
+        path = self._copy(tmp_path, "TEBIS_FK_1550092560.csv")
+        leases = LeaseManager(tmp_path, "this", lease_seconds=0.3)
+        assert leases.claim(path)
+        lease_path = tmp_path / ".leases" / "TEBIS_FK_1550092560.csv.lease"
+        expired = time.time() - 120
+        os.utime(str(lease_path), (expired, expired))
+
+        time.sleep(0.3)
+        leases.stop()
+
+        assert time.time() - lease_path.stat().st_mtime < 0.3
+
+    def test_lease_of_earlier_run_is_taken_back(self, tmp_path):
+        path = self._copy(tmp_path, "TEBIS_FK_1550092560.csv")
+        assert LeaseManager(tmp_path, "node-1").claim(path)
+
+        assert LeaseManager(tmp_path, "node-1").claim(path)
+
+    def test_process_files_skips_files_claimed_by_others(self, tmp_path, stub_client):
+        claimed = self._copy(tmp_path, "TEBIS_FK_1550092560.csv")
+        free = self._copy(tmp_path, "TEBIS_FK_1550092620.csv")
+        LeaseManager(tmp_path, "other").claim(claimed)
+        leases = LeaseManager(tmp_path, "this")
+        client = stub_client
+
+        process_files(client, mock.MagicMock(), [claimed, free], TimeSeriesCache(client), None, None, leases=leases)
+
+        assert claimed.exists() and not free.exists()
+        assert not (tmp_path / ".leases" / "TEBIS_FK_1550092620.csv.lease").exists()
+        assert client.posted
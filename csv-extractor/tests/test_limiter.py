@@ -0,0 +1,101 @@
+# coding: utf-8
+"""
+A module for testing the adaptive upload concurrency.
+"""
+import time
+from email.utils import formatdate
+from unittest import mock
+
+import numpy as np
+import pytest
+from cognite.client.exceptions import CogniteAPIError
+
+from limiter import AdaptiveLimiter
+from payload import DataPoints, encode_json, parse_retry_after, post_data_points
+from uploader import FileJob, Uploader
+
+
+class TestAdaptiveLimiter:
+    def test_throttling_halves_limit_once_per_round_trip(self):
+        limiter = AdaptiveLimiter(8)
+        sent = [limiter.acquire() for _ in range(4)]
+
+        for sent_at in sent:
+            limiter.release(sent_at, CogniteAPIError("Too many requests", 429))
+
+        assert limiter.limit == 4
+        limiter.release(limiter.acquire(), CogniteAPIError("Too many requests", 429))
+        assert limiter.limit == 2
+
+    def test_fast_requests_grow_limit_up_to_max(self):
+        limiter = AdaptiveLimiter(4, latency_target=1.0)
+        limiter.limit = 1.0
+
+        for _ in range(20):
+            limiter.release(limiter.acquire())
+
+        assert limiter.limit == 4
+
+    def test_slow_requests_lower_limit(self):
+        limiter = AdaptiveLimiter(10, latency_target=1.0)
+
+        limiter.release(limiter.acquire() - 2.0)
+
+        assert limiter.limit == pytest.approx(9)
+
+    def test_retry_after_blocks_requests(self):
+        limiter = AdaptiveLimiter(4)
+        error = CogniteAPIError("Unavailable", 503)
+        error.retry_after = 0.2
+
+        limiter.release(limiter.acquire(), error)
+
+        start_time = time.time()
+        limiter.acquire()
+        assert time.time() - start_time >= 0.15
+
+    def test_uploader_waits_for_retry_after(self):
+        error = CogniteAPIError("Too many requests", 429)
+        error.retry_after = 0.2
+        post = mock.Mock(side_effect=[error, None])
+        uploader = Uploader(mock.MagicMock(), workers=2, retry_backoff=0.001, post=post)
+        job = FileJob("a.csv")
+
+        start_time = time.time()
+        uploader.submit([job], [("a", DataPoints(np.array([1000]), np.array([1.0])))])
+        uploader.stop()
+
+        assert post.call_count == 2 and not job.failed
+        assert time.time() - start_time >= 0.15
+
+
+class TestRetryAfter:
+    def test_parse_seconds_and_dates(self):
+        assert parse_retry_after("3") == 3.0
+        assert 55 < parse_retry_after(formatdate(time.time() + 60, usegmt=True)) <= 60
+        assert parse_retry_after(None) is None
+        assert parse_retry_after("soon") is None
+
+    def test_post_is_not_retried_and_sets_retry_after(self, cdf, stub_client):
+        cdf.responses = [(429, {"Retry-After": "7"}), (503, {})]
+
+        for code, retry_after in [(429, 7.0), (503, None)]:
+            with pytest.raises(CogniteAPIError) as exc_info:
+                post_data_points(stub_client, encode_json([]))
+            assert exc_info.value.code == code
+            assert exc_info.value.retry_after == retry_after
+        assert cdf.requests == 2
+
+    def test_limiter_sees_every_throttled_request(self, cdf, stub_client):
+        cdf.responses = [(429, {"Retry-After": "0.2"})]
+        limiter = AdaptiveLimiter(4)
+        uploader = Uploader(stub_client, workers=4, retry_backoff=0.001, limiter=limiter)
+        job = FileJob("a.csv")
+
+        start_time = time.time()
+        uploader.submit([job], [("a", DataPoints(np.array([1000]), np.array([1.0])))])
+        uploader.stop()
+
+        assert cdf.requests == 2 and len(cdf.posted) == 1 and not job.failed
+        assert limiter.limit < 4
+        assert time.time() - start_time >= 0.15
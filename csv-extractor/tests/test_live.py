@@ -0,0 +1,115 @@
+# coding: utf-8
+"""
+A module for testing the event driven live extraction.
+"""
+import asyncio
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+import live
+from time_series_cache import TimeSeriesCache
+from uploader import Uploader
+
+
+def _run_until_finished(client, folder, finished_path, file_name, source):
+    uploader = Uploader(client, workers=2)
+    cache = TimeSeriesCache(client)
+
+    async def scenario():
+        task = asyncio.get_running_loop().create_task(
+            live.run_live(client, mock.MagicMock(), cache, folder, None, finished_path, uploader, poll_interval=0.05)
+        )
+        await asyncio.sleep(0.1)
+        shutil.copy(str(source), str(folder / file_name))
+        for _ in range(100):
+            if (finished_path / file_name).exists():
+                break
+            await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        uploader.stop()
+    return client
+
+
+class TestLive:
+    source = Path(__file__).parent / "test_files" / "TEBIS_FK_1550092620.csv"
+
+    def test_new_file_is_uploaded(self, tmp_path, stub_client):
+        finished_path = tmp_path / "finished"
+        finished_path.mkdir()
+
+        client = _run_until_finished(stub_client, tmp_path, finished_path, self.source.name, self.source)
+
+        assert (finished_path / self.source.name).exists()
+        assert len(client.posted[-1]) == 10
+
+    def test_polling_when_inotify_is_unavailable(self, tmp_path, stub_client):
+        finished_path = tmp_path / "finished"
+        finished_path.mkdir()
+
+        with mock.patch.object(live, "InotifyWatcher", side_effect=OSError("unavailable")):
+            _run_until_finished(stub_client, tmp_path, finished_path, self.source.name, self.source)
+
+        assert (finished_path / self.source.name).exists()
+
+    def test_parsing_waits_for_a_stalled_consumer(self, monkeypatch):
+        parsed_paths = []
+        def parse_csv_file_or_error(path):
+            parsed_paths.append(path)
+            return None, None
+
+        monkeypatch.setattr(live, "parse_csv_file_or_error", parse_csv_file_or_error)
+
+        async def scenario(executor):
+            paths, parsed = asyncio.Queue(), asyncio.Queue(maxsize=1)
+            for i in range(5):
+                paths.put_nowait("{}.csv".format(i))
+            task = asyncio.get_running_loop().create_task(live._parse_files(paths, parsed, executor, workers=1))
+            await asyncio.sleep(0.2)
+            task.cancel()
+            return parsed.qsize()
+
+        with ThreadPoolExecutor(1) as executor:
+            assert asyncio.run(scenario(executor)) == 1
+        assert parsed_paths == ["0.csv", "1.csv"]
+
+    def test_backlog_is_queued_beyond_newest_files(self, tmp_path):
+        old = time.time() - 100
+        for i in range(50):
+            path = tmp_path / "TEBIS_FK_{}.csv".format(i)
+            path.touch()
+            os.utime(str(path), (old + i, old + i))
+
+        async def scenario():
+            paths, queued = asyncio.Queue(), set()
+            task = asyncio.get_running_loop().create_task(live.watch_csv_files(tmp_path, paths, queued, 0.01))
+            await asyncio.sleep(0.5)
+            task.cancel()
+            return paths.qsize()
+
+        assert asyncio.run(scenario()) == 50
+
+    def test_failing_watcher_stops_extraction(self, tmp_path, monkeypatch):
+        async def watch_csv_files(*args):
+            raise OSError("Folder unavailable")
+
+        monkeypatch.setattr(live, "watch_csv_files", watch_csv_files)
+        uploader = mock.MagicMock()
+        cache = TimeSeriesCache(mock.MagicMock())
+        run = live.run_live(mock.MagicMock(), mock.MagicMock(), cache, tmp_path, None, None, uploader)
+
+        with pytest.raises(OSError, match="Folder unavailable"):
+            asyncio.run(asyncio.wait_for(run, 5))
@@ -0,0 +1,81 @@
+# coding: utf-8
+"""
+A module for testing the background metrics push.
+"""
+import threading
+import time
+from functools import partial
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+from prometheus_client import CollectorRegistry, Counter, pushadd_to_gateway
+
+from monitoring import MetricsPusher
+
+
+class _GatewayHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        time.sleep(self.server.delay)
+        self.server.bodies.append(self.path)
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def gateway():
+    """A local stand-in for the Prometheus push gateway, answering after 'delay' seconds."""
+    server = HTTPServer(("127.0.0.1", 0), _GatewayHandler)
+    server.delay = 0.0
+    server.bodies = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _push_to(gateway):
+    registry = CollectorRegistry()
+    Counter("pushed", "Test counter", registry=registry).inc()
+    return partial(pushadd_to_gateway, "127.0.0.1:{}".format(gateway.server_port), job="test", registry=registry)
+
+
+class TestMetricsPusher:
+    def test_request_does_not_wait_on_slow_gateway(self, gateway):
+        gateway.delay = 0.5
+        pusher = MetricsPusher(_push_to(gateway), interval=60, min_interval=0)
+
+        start_time = time.perf_counter()
+        for _ in range(100):
+            pusher.request()
+        assert time.perf_counter() - start_time < 0.2
+
+        pusher.stop()
+        # The first request starts a push, the rest are coalesced into one more, and stop pushes the last time
+        assert 1 <= len(gateway.bodies) <= 3
+        assert gateway.bodies[0] == "/metrics/job/test"
+
+    def test_pushes_on_interval_without_requests(self, gateway):
+        pusher = MetricsPusher(_push_to(gateway), interval=0.05, min_interval=0)
+
+        pusher.request()
+        time.sleep(0.5)
+        pusher.stop()
+
+        assert len(gateway.bodies) >= 3
+
+    def test_failed_push_is_logged(self, caplog):
+        pusher = MetricsPusher(_raise, interval=60)
+
+        pusher.request()
+        pusher.stop()
+
+        assert "Gateway down" in caplog.text
+
+
+def _raise():
+    raise OSError("Gateway down")
@@ -0,0 +1,44 @@
+# coding: utf-8
+"""
+A module for testing the array backed request payloads.
+"""
+
+import json
+
+import numpy as np
+
+from payload import DataPoints, encode_json, post_data_points
+
+
+class TestPayload:
+    timestamps = np.array([1000, 2000, 3000], dtype=np.int64)
+
+    def test_full_column_shares_timestamps(self):
+        data_points = DataPoints.from_column(self.timestamps, np.array([1.0, 2.0, 3.0]), np.array([True, True, True]))
+        assert data_points.timestamps is self.timestamps
+
+        data_points = DataPoints.from_column(self.timestamps, np.array([1.0, 2.0, 3.0]), np.array([True, False, True]))
+        assert data_points.to_tuples() == [(1000, 1.0), (3000, 3.0)]
+
+    def test_encode_json_matches_sdk_request_body(self):
+        items = [
+            ("a", DataPoints(self.timestamps, np.array([0.1, -2.5e-07, 1e16]))),
+            ('quote"d', DataPoints(self.timestamps[:1], np.array([4.0]))),
+        ]
+        expected = {
+            "items": [
+                {"externalId": external_id, "datapoints": [{"timestamp": t, "value": v} for t, v in dps.to_tuples()]}
+                for external_id, dps in items
+            ]
+        }
+
+        assert json.loads(encode_json(items)) == expected
+
+    def test_post_gzipped_to_datapoints_endpoint(self, stub_client):
+        client = stub_client
+
+        post_data_points(client, encode_json([("a", DataPoints(self.timestamps, np.ones(3)))]))
+
+        assert client.posted == [
+            [{"externalId": "a", "datapoints": [{"timestamp": t, "value": 1.0} for t in [1000, 2000, 3000]]}]
+        ]
@@ -0,0 +1,80 @@
+# coding: utf-8
+"""
+A module for testing the header schema cache.
+"""
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+from batching import DatapointBatcher
+from csv_extractor import process_csv_file
+from schema import EMPTY, NUMERIC, STRING, ColumnSchema, SchemaCache
+from time_series_cache import TimeSeriesCache
+from uploader import FileJob
+
+
+class TestSchema:
+    folder_path = Path(__file__).parent / "test_files"  # folder with input data
+
+    def test_columns_without_external_id_are_ignored(self):
+        schema = ColumnSchema(["33 : TEST3", "", "no external id", " extIdTwo:name2"])
+
+        assert schema.columns == [(0, "33", "TEST3"), (3, "extIdTwo", "name2")]
+
+    def test_columns_are_classified_once(self):
+        schema = ColumnSchema(["1 : A", "2 : B", "3 : C"])
+        valid = np.array([[True, False], [False, False], [False, False]])
+
+        assert schema.classify(valid, np.array([0, 2, 0])) == [(0, "1", "A")]
+        assert schema.kinds == {0: NUMERIC, 1: STRING, 2: EMPTY}
+
+        assert schema.classify(~valid, np.array([2, 0, 0])) == [(0, "1", "A"), (1, "2", "B"), (2, "3", "C")]
+        assert schema.kinds == {0: NUMERIC, 1: NUMERIC, 2: NUMERIC}
+
+    def test_column_empty_in_first_file_is_read_from_later_files(self, tmp_path):
+        batcher = mock.MagicMock()
+        time_series_cache = TimeSeriesCache(mock.MagicMock())
+        for i, cells in enumerate(["", "1,5", "2,5"]):
+            file_path = tmp_path / "{}.csv".format(i)
+            rows = "".join("{};1;{}\n".format(10 * i + ts, cells) for ts in range(5))
+            file_path.write_text(";1 : A;2 : B\nZeitstempel;bar;bar\n" + rows, encoding="latin-1")
+            process_csv_file(mock.MagicMock(), mock.MagicMock(), batcher, FileJob(file_path), time_series_cache)
+
+        counts = [len(c[0][2]) for c in batcher.add.call_args_list if c[0][1] == "2"]
+        assert counts == [5, 5]
+
+    def test_rejected_cells_are_counted_per_file(self, tmp_path):
+        monitor = mock.MagicMock()
+        batcher = mock.MagicMock()
+        file_path = tmp_path / "status.csv"
+        file_path.write_text(";1 : A;2 : B\nZeitstempel;;bar\n10;Aus;1\n11;Ein;2\n12;Aus;\n", encoding="latin-1")
+
+        process_csv_file(mock.MagicMock(), monitor, batcher, FileJob(file_path), TimeSeriesCache(mock.MagicMock()))
+
+        monitor.rejected_cells_counter.inc.assert_called_once_with(3)
+        assert [c[0][1] for c in batcher.add.call_args_list] == ["2"]
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = SchemaCache(max_size=2)
+        cache.get("a", ["1 : A"])
+        cache.get("b", ["2 : B"])
+        assert cache.get("a", ["1 : A"])[1]
+        cache.get("c", ["3 : C"])
+
+        assert cache.get("a", ["1 : A"])[1]
+        assert not cache.get("b", ["2 : B"])[1]
+
+    def test_time_series_are_checked_once_per_header(self):
+        client = mock.MagicMock()
+        monitor = mock.MagicMock()
+        time_series_cache = TimeSeriesCache(client)
+        batcher = DatapointBatcher(mock.MagicMock())
+
+        for _ in range(2):
+            job = FileJob(self.folder_path / "TEBIS_FK_1550092620.csv")
+            process_csv_file(client, monitor, batcher, job, time_series_cache)
+
+        client.time_series.retrieve_multiple.assert_called_once()
+        client.time_series.create.assert_called_once()
+        assert monitor.incr_schema_cache_counter.call_args_list == [mock.call(False), mock.call(True)]
@@ -0,0 +1,149 @@
+# coding: utf-8
+"""
+A module for testing the upload spool.
+"""
+import time
+from unittest import mock
+
+import numpy as np
+from cognite.client.exceptions import CogniteAPIError
+
+from payload import DataPoints, encode_json
+from spool import UploadSpool, decode_request, encode_request
+import uploader as uploader_module
+from uploader import FileJob, Uploader
+
+
+class TestUploadSpool:
+    request = [
+        ("a", DataPoints(np.array([1550092501000, 1550092502000]), np.array([1.5, -2.25]))),
+        ("bø", DataPoints(np.array([], dtype=np.int64), np.array([]))),
+    ]
+
+    def test_encode_round_trip(self):
+        assert decode_request(encode_request(self.request)) == self.request
+
+    def test_requests_removed_when_acknowledged(self, tmp_path):
+        spool = UploadSpool(tmp_path)
+        first = spool.write(self.request)
+        second = spool.write(self.request)
+
+        assert spool.pending() == [first, second]
+        spool.ack(first)
+        assert spool.pending() == [second]
+        assert spool.read(second) == self.request
+
+    def test_transient_errors_are_retried(self, tmp_path):
+        post = mock.Mock(side_effect=[CogniteAPIError("Busy", 503), OSError("Reset"), None])
+        spool = UploadSpool(tmp_path)
+        uploader = Uploader(mock.MagicMock(), workers=1, spool=spool, retry_backoff=0.001, post=post)
+        job = FileJob("a.csv")
+
+        uploader.submit([job], self.request)
+        uploader.stop()
+
+        assert post.call_count == 3
+        assert not job.failed
+        assert len(spool) == 0
+
+    def test_unacknowledged_requests_are_replayed(self, tmp_path):
+        post = mock.Mock(side_effect=CogniteAPIError("Busy", 503))
+        spool = UploadSpool(tmp_path)
+        uploader = Uploader(mock.MagicMock(), workers=1, spool=spool, retries=1, retry_backoff=0.001, post=post)
+        job = FileJob("a.csv")
+        uploader.submit([job], self.request)
+        uploader.stop()
+        assert not job.failed  # The file is done, its datapoints are kept in the spool
+
+        post = mock.Mock()
+        spool = UploadSpool(tmp_path)
+        Uploader(mock.MagicMock(), workers=1, spool=spool, post=post).stop()
+
+        post.assert_called_once_with(encode_json(self.request))
+        assert len(spool) == 0
+
+    def test_kept_requests_are_replayed_after_next_success(self, tmp_path):
+        post = mock.Mock(side_effect=[CogniteAPIError("Busy", 503)] * 2 + [None] * 2)
+        spool = UploadSpool(tmp_path)
+        uploader = Uploader(mock.MagicMock(), workers=1, spool=spool, retries=1, retry_backoff=0.001, post=post)
+
+        uploader.submit([FileJob("a.csv")], self.request)
+        uploader.join()
+        assert len(spool) == 1
+        uploader.submit([FileJob("b.csv")], self.request[:1])
+        uploader.join()
+        uploader.stop()
+
+        replayed = [mock.call(encode_json(self.request[:1])), mock.call(encode_json(self.request))]
+        assert post.call_args_list[2:] == replayed
+        assert len(spool) == 0
+
+    def test_kept_requests_are_replayed_when_idle(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(uploader_module, "SPOOL_REPLAY_INTERVAL", 0.05)
+        post = mock.Mock(side_effect=[CogniteAPIError("Busy", 503)] * 2 + [None])
+        spool = UploadSpool(tmp_path)
+        uploader = Uploader(mock.MagicMock(), workers=1, spool=spool, retries=1, retry_backoff=0.001, post=post)
+
+        uploader.submit([FileJob("a.csv")], self.request)
+        for _ in range(40):
+            if not len(spool):
+                break
+            time.sleep(0.05)
+        uploader.stop()
+
+        assert post.call_count == 3
+        assert len(spool) == 0
+
+    def test_rejected_requests_are_not_retried(self, tmp_path):
+        post = mock.Mock(side_effect=CogniteAPIError("Bad request", 400))
+        spool = UploadSpool(tmp_path)
+        uploader = Uploader(mock.MagicMock(), workers=1, spool=spool, retry_backoff=0.001, post=post)
+        job = FileJob("a.csv")
+
+        uploader.submit([job], self.request)
+        uploader.stop()
+
+        assert post.call_count == 1
+        assert job.failed
+        assert len(spool) == 0
+
+    def test_kept_requests_are_sent_again_when_stopping(self, tmp_path):
+        post = mock.Mock(side_effect=[CogniteAPIError("Busy", 503)] * 2 + [None])
+        spool = UploadSpool(tmp_path)
+        uploader = Uploader(mock.MagicMock(), workers=1, spool=spool, retries=1, retry_backoff=0.001, post=post)
+
+        uploader.submit([FileJob("a.csv")], self.request)
+        uploader.stop()
+
+        assert post.call_count == 3
+        assert uploader.unsent == 0
+        assert len(spool) == 0
+
+    def test_unsent_requests_are_counted_when_stopping(self, tmp_path):
+        post = mock.Mock(side_effect=CogniteAPIError("Busy", 503))
+        spool = UploadSpool(tmp_path)
+        uploader = Uploader(mock.MagicMock(), workers=1, spool=spool, retries=1, retry_backoff=0.001, post=post)
+
+        uploader.submit([FileJob("a.csv")], self.request)
+        uploader.stop()
+
+        assert uploader.unsent == 1
+        assert len(spool) == 1
+
+    def test_posted_datapoints_counted_when_acknowledged(self, tmp_path):
+        monitor = mock.MagicMock()
+        post = mock.Mock(side_effect=[CogniteAPIError("Busy", 503)] * 2 + [None])
+        spool = UploadSpool(tmp_path)
+        uploader = Uploader(
+            mock.MagicMock(), workers=1, monitor=monitor, spool=spool, retries=1, retry_backoff=0.001, post=post
+        )
+
+        uploader.submit([FileJob("a.csv")], self.request)
+        uploader.join()
+        monitor.incr_total_data_points_counter.assert_not_called()
+        uploader.stop()
+
+        monitor.incr_total_data_points_counter.assert_called_once_with(2)
+        monitor.spooled_requests_gauge.set.assert_called_once_with(0)
+        monitor.spooled_requests_gauge.inc.assert_called_once_with()
+        monitor.spooled_requests_gauge.dec.assert_called_once_with()
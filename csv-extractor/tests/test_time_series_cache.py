@@ -0,0 +1,51 @@
+# coding: utf-8
+"""
+A module for testing the time series cache.
+"""
+from unittest import mock
+
+from cognite.client.data_classes.time_series import TimeSeries
+from cognite.client.exceptions import CogniteAPIError
+
+from time_series_cache import TimeSeriesCache
+
+
+class TestTimeSeriesCache:
+    def test_lookup_only_queries_unknown_and_persists(self, tmp_path):
+        path = tmp_path / "cache.sqlite"
+        client = mock.MagicMock()
+        client.time_series.retrieve_multiple.return_value = [TimeSeries(external_id="a", name="A")]
+
+        assert TimeSeriesCache(client, path).lookup(["a", "b"]) == ["b"]
+
+        client.time_series.retrieve_multiple.reset_mock()
+        cache = TimeSeriesCache(client, path)
+        assert "a" in cache and cache["a"] == "A"
+        assert cache.lookup(["a"]) == []
+        client.time_series.retrieve_multiple.assert_not_called()
+
+    def test_expired_entries_are_looked_up_and_evicted(self):
+        client = mock.MagicMock()
+        client.time_series.retrieve_multiple.return_value = []
+        cache = TimeSeriesCache(client, ttl=-1)
+        cache["a"] = "A"
+
+        assert cache.lookup(["a"]) == ["a"]
+        assert "a" not in cache
+
+    def test_create_in_chunks_and_retry_without_duplicates(self):
+        client = mock.MagicMock()
+        client.time_series.create.side_effect = [
+            CogniteAPIError("Duplicated", code=409, duplicated=[{"externalId": "b"}]),
+            None,
+            None,
+        ]
+        cache = TimeSeriesCache(client)
+
+        with mock.patch("time_series_cache.CREATE_MAX", 2):
+            created = cache.create({"a": "A", "b": "B", "c": "C"})
+
+        assert created == 2
+        requests = [[ts.external_id for ts in c[0][0]] for c in client.time_series.create.call_args_list]
+        assert requests == [["a", "b"], ["a"], ["c"]]
+        assert all(ext_id in cache for ext_id in "abc")
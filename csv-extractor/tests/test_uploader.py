@@ -0,0 +1,86 @@
+# coding: utf-8
+"""
+A module for testing the upload pool.
+"""
+import json
+import threading
+from unittest import mock
+
+import numpy as np
+
+from payload import DataPoints
+from uploader import FileJob, Uploader
+
+
+def _request(external_id, *timestamps):
+    return [(external_id, DataPoints(np.array(timestamps, dtype=np.int64), np.ones(len(timestamps))))]
+
+
+class TestUploader:
+    def test_file_job_done_after_seal_and_all_batches(self, stub_client):
+        client = stub_client
+        done = []
+        uploader = Uploader(client, workers=2)
+        job = FileJob("a.csv", done.append)
+
+        uploader.submit([job], _request("a", 1000))
+        uploader.submit([job], _request("b", 1000, 2000))
+        uploader.join()
+        assert done == []
+
+        job.seal()
+        uploader.stop()
+        assert done == [job]
+        assert not job.failed
+        assert sorted(client.posted, key=lambda items: items[0]["externalId"]) == [
+            [{"externalId": "a", "datapoints": [{"timestamp": 1000, "value": 1.0}]}],
+            [{"externalId": "b", "datapoints": [{"timestamp": 1000, "value": 1.0}, {"timestamp": 2000, "value": 1.0}]}],
+        ]
+
+    def test_failed_batch_marks_job_failed(self):
+        post = mock.Mock(side_effect=[None, Exception("API down")])
+        uploader = Uploader(mock.MagicMock(), workers=1, post=post)
+        job = FileJob("a.csv")
+
+        uploader.submit([job], _request("a", 1000))
+        uploader.submit([job], _request("a", 2000))
+        uploader.stop()
+
+        assert job.failed
+
+    def test_submit_blocks_when_queue_is_full(self):
+        release = threading.Event()
+        uploader = Uploader(mock.MagicMock(), workers=1, queue_size=1, post=lambda _: release.wait())
+        job = FileJob("a.csv")
+        batch = _request("a", 1000)
+
+        uploader.submit([job], batch)  # Taken by the worker
+        uploader.submit([job], batch)  # Fills the queue
+        blocked = threading.Thread(target=uploader.submit, args=([job], batch))
+        blocked.start()
+        blocked.join(0.2)
+        assert blocked.is_alive()
+
+        release.set()
+        blocked.join()
+        uploader.stop()
+
+    def test_requests_reported_to_monitor(self):
+        monitor = mock.MagicMock()
+        bodies = []
+        uploader = Uploader(mock.MagicMock(), workers=1, monitor=monitor, post=bodies.append)
+        job = FileJob("a.csv")
+
+        uploader.submit([job], _request("a", 1000) + _request("b"))
+        uploader.stop()
+
+        assert json.loads(bodies[0]) == {
+            "items": [
+                {"externalId": "a", "datapoints": [{"timestamp": 1000, "value": 1.0}]},
+                {"externalId": "b", "datapoints": []},
+            ]
+        }
+
+        monitor.upload_size_histogram.observe.assert_called_once_with(1)
+        assert monitor.upload_histogram.observe.call_count == 1
+        assert monitor.in_flight_requests_gauge.inc.call_count == monitor.in_flight_requests_gauge.dec.call_count == 1
@@ -0,0 +1,121 @@
+# coding: utf-8
+"""
+A module for caching which time series exist in CDF.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List
+
+from cognite.client.data_classes.time_series import TimeSeries
+from cognite.client.exceptions import CogniteAPIError
+
+from schema import SchemaCache
+
+logger = logging.getLogger(__name__)
+
+RETRIEVE_MAX = 1000  # Maximum number of external IDs looked up in one request
+CREATE_MAX = 1000  # Maximum number of time series created in one request
+
+
+class TimeSeriesCache:
+    """Map of externalId -> name of time series known to exist in CDF, persisted in a SQLite file at 'path'.
+
+    Only externalIds seen in csv headers are looked up in CDF, and missing ones created. Entries older than 'ttl'
+    seconds are looked up again the next time they are seen, and evicted if the time series no longer exists.
+    The column mappings of headers seen are kept in 'schemas'.
+    """
+
+    def __init__(self, client, path=None, ttl: float = 24 * 3600):
+        self.client = client
+        self.ttl = ttl
+        self.schemas = SchemaCache()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(":memory:" if path is None else str(path), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS time_series (external_id TEXT PRIMARY KEY, name TEXT, fetched_at REAL)"
+        )
+        rows = self._db.execute("SELECT external_id, name, fetched_at FROM time_series")
+        self._entries = {external_id: (name, fetched_at) for external_id, name, fetched_at in rows}
+        logger.info("Loaded {} time series from cache".format(len(self._entries)))
+
+    def __contains__(self, external_id: str) -> bool:
+        return external_id in self._entries
+
+    def __getitem__(self, external_id: str) -> str:
+        return self._entries[external_id][0]
+
+    def __setitem__(self, external_id: str, name: str) -> None:
+        self._store([(external_id, name)])
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, external_ids: Iterable[str]) -> List[str]:
+        """Return the 'external_ids' that don't exist in CDF, looking up those unknown or expired in the cache."""
+        expired_before = time.time() - self.ttl
+        stale = [ext_id for ext_id in set(external_ids) if self._entries.get(ext_id, (None, 0))[1] < expired_before]
+        if not stale:
+            return []
+
+        found = []
+        for i in range(0, len(stale), RETRIEVE_MAX):
+            chunk = stale[i : i + RETRIEVE_MAX]
+            found.extend(
+                (ts.external_id, ts.name)
+                for ts in self.client.time_series.retrieve_multiple(external_ids=chunk, ignore_unknown_ids=True)
+            )
+        self._store(found)
+
+        missing = set(stale).difference(ext_id for ext_id, _ in found)
+        self._evict(missing)
+        return sorted(missing)
+
+    def create(self, names: Dict[str, str]) -> int:
+        """Create time series for the externalId -> name in 'names' in bulk, and return how many were created.
+
+        Time series created meanwhile by someone else, like another extractor, are reported as duplicated by the API.
+        These are cached as existing, and the rest of the request is sent again.
+        """
+        created = 0
+        items = sorted(names.items())
+        for i in range(0, len(items), CREATE_MAX):
+            chunk = dict(items[i : i + CREATE_MAX])
+            while chunk:
+                new_time_series = [
+                    TimeSeries(
+                        name=name, description="Auto-generated time series, external ID not found", external_id=ext_id
+                    )
+                    for ext_id, name in chunk.items()
+                ]
+                try:
+                    self.client.time_series.create(new_time_series)
+                except CogniteAPIError as exc:
+                    duplicated = {item.get("externalId") for item in exc.duplicated or []}.intersection(chunk)
+                    if exc.code != 409 or not duplicated:
+                        logger.error("Failed to create {} time series: {!s}".format(len(chunk), exc))
+                        break
+                    self._store([(ext_id, chunk.pop(ext_id)) for ext_id in duplicated])
+                else:
+                    self._store(chunk.items())
+                    created += len(chunk)
+                    break
+        return created
+
+    def _store(self, items) -> None:
+        now = time.time()
+        with self._lock:
+            for external_id, name in items:
+                self._entries[external_id] = (name, now)
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO time_series VALUES (?, ?, ?)", ((e, n, now) for e, n in items)
+                )
+
+    def _evict(self, external_ids) -> None:
+        with self._lock:
+            for external_id in external_ids:
+                self._entries.pop(external_id, None)
+            with self._db:
+                self._db.executemany("DELETE FROM time_series WHERE external_id = ?", ((e,) for e in external_ids))
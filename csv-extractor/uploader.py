@@ -0,0 +1,279 @@
+# coding: utf-8
+"""
+A module for uploading datapoints to CDF from a fixed pool of threads.
+"""
+import logging
+import random
+import threading
+import time
+from collections import deque
+from functools import partial
+from queue import Empty, Full, Queue
+from typing import List
+
+from cognite.client.exceptions import CogniteAPIError
+
+from limiter import AdaptiveLimiter
+from payload import encode_json, post_data_points
+
+logger = logging.getLogger(__name__)
+
+RETRY_MAX = 5  # Number of times a request failing with a transient error is sent again
+RETRY_BACKOFF = 1.0  # Seconds to wait before the first retry, doubled for each retry
+RETRY_BACKOFF_MAX = 60.0
+TRANSIENT_CODES = (429, 500, 502, 503, 504)
+SPOOL_REPLAY_INTERVAL = 60.0  # Seconds without requests before requests kept in the spool are sent again
+
+
+def is_transient(exc: Exception) -> bool:
+    """Return whether the request failing with 'exc' may succeed if sent again."""
+    if isinstance(exc, CogniteAPIError):
+        return exc.code in TRANSIENT_CODES
+    return isinstance(exc, OSError)  # Includes the connection errors and timeouts of requests
+
+
+class FileJob:
+    """Track the upload batches of one csv file, calling 'on_done(job)' once the file is sealed and all are done.
+
+    'watermarks' maps the externalIds in the file to their latest timestamp. Each time a request with datapoints from
+    the file is acknowledged, 'on_uploaded(job, ranges)' is called with the (externalId, first, last) time ranges of
+    those datapoints.
+    """
+
+    def __init__(self, path, on_done=None, on_uploaded=None):
+        self.path = path
+        self.on_done = on_done
+        self.on_uploaded = on_uploaded
+        self.failed = False
+        self.data_points_count = 0
+        self.watermarks = {}
+        self._pending = 0
+        self._sealed = False
+        self._lock = threading.Lock()
+
+    def add_data_points(self, count: int) -> None:
+        with self._lock:
+            self.data_points_count += count
+
+    def add_batch(self) -> None:
+        with self._lock:
+            self._pending += 1
+
+    def batch_done(self, failed: bool = False) -> None:
+        with self._lock:
+            self._pending -= 1
+            self.failed = self.failed or failed
+            done = self._sealed and self._pending == 0
+        if done:
+            self._done()
+
+    def uploaded(self, ranges: list) -> None:
+        if self.on_uploaded is not None:
+            try:
+                self.on_uploaded(self, ranges)
+            except Exception as exc:
+                logger.error("Failed to record progress of file {!s}: {!s}".format(self.path, exc))
+
+    def seal(self) -> None:
+        """Mark that no more batches will be added for this file."""
+        with self._lock:
+            self._sealed = True
+            done = self._pending == 0
+        if done:
+            self._done()
+
+    def _done(self) -> None:
+        if self.on_done is not None:
+            try:
+                self.on_done(self)
+            except Exception as exc:
+                logger.error("Failed to finish file {!s}: {!s}".format(self.path, exc))
+
+
+class Uploader:
+    """A long-lived pool of 'workers' threads posting batches of time series with 'client'.
+
+    Each request is serialized to a JSON body in the upload thread and sent with 'post(body)', by default to the
+    datapoints endpoint of 'client'.
+
+    Batches are passed through a queue of at most 'queue_size' batches, so 'submit' blocks when the uploads can't keep
+    up with the parsing. The threads share the client, and thereby its pool of HTTP connections. Request latency,
+    size, queue depth and requests in flight are reported to 'monitor' if given.
+
+    At most 'limiter.limit' requests are in flight, adapting to how fast CDF answers and whether it throttles. Requests
+    failing with a transient error are retried up to 'retries' times with exponential backoff, or after the time the
+    API asked for if longer. With a 'spool', requests are written to it before they are queued and removed once
+    acknowledged, and requests left in it by an earlier run are uploaded first. A file whose requests are still spooled
+    after the retries is not failed, its requests are queued again after the next request succeeds, or after
+    SPOOL_REPLAY_INTERVAL seconds without requests. Datapoints are counted as posted in 'monitor' once acknowledged.
+    """
+
+    def __init__(
+        self,
+        client,
+        workers: int = 10,
+        queue_size: int = None,
+        monitor=None,
+        spool=None,
+        retries: int = RETRY_MAX,
+        retry_backoff: float = RETRY_BACKOFF,
+        post=None,
+        limiter: AdaptiveLimiter = None,
+    ):
+        self.client = client
+        self.post = partial(post_data_points, client) if post is None else post
+        self.limiter = AdaptiveLimiter(workers, monitor=monitor) if limiter is None else limiter
+        self.monitor = monitor
+        self.spool = spool
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.queue = Queue(maxsize=queue_size or 2 * workers)
+        self._kept = deque()  # Spooled requests that failed after the retries, to be queued again
+        self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+        if spool is not None:
+            pending = spool.pending()
+            if pending:
+                logger.info("Replaying {} spooled requests".format(len(pending)))
+            if monitor is not None:
+                monitor.spooled_requests_gauge.set(len(pending))
+            for path in pending:
+                self.queue.put(([], None, path, {}))
+
+    def submit(self, jobs: List[FileJob], items: list, ranges: dict = None) -> None:
+        """Queue a request of (externalId, DataPoints) with datapoints from the files of 'jobs'.
+
+        'ranges' maps each job to the (externalId, first, last) time ranges of its datapoints in the request.
+        """
+        spooled = None if self.spool is None else self.spool.write(items)
+        if spooled is not None and self.monitor is not None:
+            self.monitor.spooled_requests_gauge.inc()
+        for job in jobs:
+            job.add_batch()
+        self.queue.put((jobs, items, spooled, ranges or {}))
+        if self.monitor is not None:
+            self.monitor.upload_queue_gauge.set(self.queue.qsize())
+
+    def join(self) -> None:
+        """Block until every submitted batch is uploaded."""
+        self.queue.join()
+
+    @property
+    def unsent(self) -> int:
+        """Number of requests kept in the spool, as they failed after the retries."""
+        return len(self._kept)
+
+    def stop(self) -> None:
+        """Finish the queued batches, then stop the threads.
+
+        Requests kept in the spool are first sent again, up to 'retries' more times with backoff.
+        """
+        self.join()
+        for attempt in range(self.retries):
+            if not self._kept:
+                break
+            time.sleep(min(self.retry_backoff * 2 ** attempt, RETRY_BACKOFF_MAX))
+            self._requeue_kept()
+            self.join()
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                item = self.queue.get(timeout=SPOOL_REPLAY_INTERVAL)
+            except Empty:
+                self._requeue_kept()
+                continue
+            try:
+                if item is None:
+                    return
+                jobs, items, spooled, ranges = item
+                failed = self._upload(jobs, items, spooled, ranges)
+                for job in jobs:
+                    job.batch_done(failed)
+            finally:
+                self.queue.task_done()
+
+    def _upload(self, jobs: List[FileJob], items: list, spooled, ranges: dict) -> bool:
+        """Upload the request, and return whether it failed for good."""
+        try:
+            if items is None:
+                items = self.spool.read(spooled)
+            count = sum(len(data_points) for _, data_points in items)
+            self._post_with_retries(encode_json(items), count)
+        except Exception as error:
+            paths = ", ".join(str(job.path) for job in jobs) or str(spooled)
+            if spooled is not None and is_transient(error):
+                logger.warning("Failed to upload datapoints from {}, kept in spool: {!s}".format(paths, error))
+                self._kept.append(spooled)
+                return False
+            logger.info("Failed to upload datapoints from {}: {!s}".format(paths, error))
+            failed = True
+        else:
+            failed = False
+            if self.monitor is not None:
+                self.monitor.incr_total_data_points_counter(count)
+            for job in jobs:
+                if job in ranges:
+                    job.uploaded(ranges[job])
+
+        if spooled is not None:
+            self.spool.ack(spooled)
+            if self.monitor is not None:
+                self.monitor.spooled_requests_gauge.dec()
+        if not failed:
+            self._requeue_kept()
+        return failed
+
+    def _requeue_kept(self) -> None:
+        """Queue the spooled requests kept after failing again, as far as there is room in the queue."""
+        while True:
+            try:
+                spooled = self._kept.popleft()
+            except IndexError:
+                return
+            try:
+                self.queue.put_nowait(([], None, spooled, {}))
+            except Full:
+                self._kept.appendleft(spooled)
+                return
+            logger.info("Replaying spooled request {!s}".format(spooled))
+
+    def _post_with_retries(self, body: bytes, count: int) -> None:
+        for attempt in range(self.retries + 1):
+            sent_at = self.limiter.acquire()
+            try:
+                self._post(body, count)
+            except Exception as exc:
+                self.limiter.release(sent_at, exc)
+                if attempt == self.retries or not is_transient(exc):
+                    raise
+                delay = min(self.retry_backoff * 2 ** attempt, RETRY_BACKOFF_MAX) * random.uniform(0.5, 1.0)
+                delay = max(delay, getattr(exc, "retry_after", None) or 0)
+                logger.info("Upload failed, retrying in {:.1f} seconds: {!s}".format(delay, exc))
+                if self.monitor is not None:
+                    self.monitor.upload_retries_counter.inc()
+                time.sleep(delay)
+            else:
+                self.limiter.release(sent_at)
+                return
+
+    def _post(self, body: bytes, count: int) -> None:
+        if self.monitor is None:
+            self.post(body)
+            return
+
+        self.monitor.upload_queue_gauge.set(self.queue.qsize())
+        self.monitor.upload_size_histogram.observe(count)
+        self.monitor.in_flight_requests_gauge.inc()
+        start_time = time.perf_counter()
+        try:
+            self.post(body)
+        finally:
+            self.monitor.upload_histogram.observe(time.perf_counter() - start_time)
+            self.monitor.in_flight_requests_gauge.dec()